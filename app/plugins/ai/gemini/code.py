@@ -1,10 +1,13 @@
 import asyncio
+import functools
+import hashlib
 import io
 import pathlib
+import time
 
 import pyrogram
 from google.genai.types import File, Part
-from ub_core import BOT, LOGGER, Message, ub_core_dirname
+from ub_core import BOT, LOGGER, CustomDB, Message, ub_core_dirname
 from ub_core.utils import MediaExtensions, bytes_to_mb
 
 from app import extra_config
@@ -17,6 +20,9 @@ from app.plugins.ai.gemini import (
     send_message_with_retry_delay_guard,
     utils,
 )
+from app.plugins.ai.gemini.client import DB_SETTINGS
+
+INDEX_DB = CustomDB["GEMINI_CODEBASE_INDEX"]
 
 PYRO_PATH = pathlib.Path(pyrogram.__file__).parent.resolve()
 
@@ -27,6 +33,10 @@ if extra_config.INDEX_EXTRA_MODULES:
     CODEBASE_PATHS.append(EXTRA_MODULES)
 
 CODEBASE_INDEX_FILE = None
+# Uploads this close to expiry are replaced instead of reused
+UPLOAD_EXPIRY_MARGIN = 3600
+# Gemini keeps uploaded files for 48 hours
+UPLOAD_TTL = 172800
 
 
 def replace_indents(line: str, char: str = "@") -> str:
@@ -49,9 +59,25 @@ def shrink_file(
     de_indent: bool = False,
     indent_size: int = 4,
     replace_indent: bool = True,
+) -> str:
+    return shrink_text(
+        file.read_text(encoding="utf-8", errors="ignore"),
+        comments=comments,
+        de_indent=de_indent,
+        indent_size=indent_size,
+        replace_indent=replace_indent,
+    )
+
+
+def shrink_text(
+    text: str,
+    comments: bool = False,
+    de_indent: bool = False,
+    indent_size: int = 4,
+    replace_indent: bool = True,
 ) -> str:
     parts = []
-    for line in file.read_text(encoding="utf-8", errors="ignore").splitlines():
+    for line in text.splitlines():
         _line = line.strip()
 
         if not _line:
@@ -92,26 +118,8 @@ def get_pyro_file_contents(file_paths: list[str]) -> str:
     return "".join(contents)
 
 
-async def upload_codebase(refresh: bool = False) -> File:
-    """
-    info:
-        Upload project context to file storage
-    args:
-        refresh: set to True to force re-upload of context.
-    returns:
-        uploaded file
-    """
-    global CODEBASE_INDEX_FILE
-
-    if CODEBASE_INDEX_FILE and not refresh:
-        try:
-            await async_client.files.get(name=CODEBASE_INDEX_FILE.name)
-            return CODEBASE_INDEX_FILE
-        except Exception as e:
-            LOGGER.error(f"Error accessing uploaded codebase file: {e}\nAuto Refreshing...")
-
-    codebase_parts = []
-
+def list_codebase_files() -> list[pathlib.Path]:
+    files = []
     for root in CODEBASE_PATHS:
         for file in sorted(root.rglob("*")):
             file = file.resolve()
@@ -123,24 +131,174 @@ async def upload_codebase(refresh: bool = False) -> File:
                 continue
 
             if file.suffix in MediaExtensions.CODE:
-                try:
-                    codebase_parts.append(shrink_file(file))
-                except Exception as e:
-                    codebase_parts.append(str(e))
+                files.append(file)
+    return files
+
+
+def read_entry(file: pathlib.Path, entry: dict | None) -> dict | None:
+    """
+    :return: A new index entry for file, None if entry is still current.
+        Files are only re-read when their size or mtime changed
+        and only re-shrunk when their content hash changed.
+    """
+    stat = file.stat()
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return None
+
+    try:
+        data = file.read_bytes()
+    except Exception as e:
+        return {"_id": str(file), "hash": "", "mtime_ns": 0, "size": -1, "text": str(e)}
+
+    content_hash = hashlib.sha1(data).hexdigest()
+    if entry and entry["hash"] == content_hash:
+        text = entry["text"]
+    else:
+        text = shrink_text(data.decode("utf-8", errors="ignore"))
+
+    return {"_id": str(file), "hash": content_hash, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "text": text}
+
+
+class CodebaseIndex:
+    """
+    Shrunk codebase files keyed by path, persisted in GEMINI_CODEBASE_INDEX
+    with their content hashes so refreshes only re-process changed files.
+    """
+
+    def __init__(self):
+        self.entries: dict[str, dict] = {}
+        # Paths in index order and digest of the tree, as of the last scan
+        self.paths: list[str] = []
+        self.digest = ""
+        self.is_loaded = False
+        self._lock = asyncio.Lock()
 
-                codebase_parts.append(f"\n##### {file} #####\n")
+    async def load(self):
+        async for entry in INDEX_DB.find():
+            self.entries[entry["_id"]] = entry
+        self.is_loaded = True
 
-    codebase_parts.append(f"\n\n\nPyrogram file path tree:\n{sorted(PYRO_PATH.rglob('*py'))}")
+    def _scan(self) -> tuple[list[dict], list[str]]:
+        files = list_codebase_files()
+        changed = [entry for file in files if (entry := read_entry(file, self.entries.get(str(file))))]
+        self.paths = [str(file) for file in files]
+        paths = set(self.paths)
+        removed = [path for path in self.entries if path not in paths]
 
-    joined_codebase = "".join(codebase_parts)
+        # Hash of every indexed path and content, changes whenever the built index would
+        hashes = {entry["_id"]: entry["hash"] for entry in changed}
+        digest = hashlib.sha1()
+        for path in sorted(paths):
+            digest.update(f"{path}:{hashes[path] if path in hashes else self.entries[path]['hash']}\n".encode())
+        digest.update(pyro_tree().encode())
+        self.digest = digest.hexdigest()
+
+        return changed, removed
+
+    async def update(self) -> int:
+        """
+        Sync the index with the files on disk.
+        :return: Number of added, changed or removed files.
+        """
+        async with self._lock:
+            if not self.is_loaded:
+                await self.load()
+
+            changed, removed = await asyncio.to_thread(self._scan)
+
+            for entry in changed:
+                self.entries[entry["_id"]] = entry
+                await INDEX_DB.add_data(entry)
+
+            for path in removed:
+                self.entries.pop(path)
+                await INDEX_DB.delete_data({"_id": path})
+
+            return len(changed) + len(removed)
+
+    def build(self) -> str:
+        codebase_parts = []
+        for path in self.paths:
+            codebase_parts.append(self.entries[path]["text"])
+            codebase_parts.append(f"\n##### {path} #####\n")
+
+        codebase_parts.append(f"\n\n\nPyrogram file path tree:\n{pyro_tree()}")
+        return "".join(codebase_parts)
+
+
+@functools.cache
+def pyro_tree() -> str:
+    """Pyrogram doesn't change while running, walk its tree once."""
+    return str(sorted(PYRO_PATH.rglob("*py")))
+
+
+CODEBASE_INDEX = CodebaseIndex()
+
+
+async def init_task():
+    await asyncio.to_thread(pyro_tree)
+
+
+async def get_saved_upload(digest: str) -> File | None:
+    """The uploaded index of the last build if it matches digest and hasn't expired."""
+    saved = await DB_SETTINGS.find_one({"_id": "gemini_codebase_upload"})
+    if not saved or saved["digest"] != digest or saved["expires"] - UPLOAD_EXPIRY_MARGIN < time.time():
+        return None
+
+    try:
+        return await async_client.files.get(name=saved["name"])
+    except Exception as e:
+        LOGGER.error(f"Error accessing uploaded codebase file: {e}\nAuto Refreshing...")
+        return None
+
+
+async def upload_codebase(refresh: bool = False) -> File:
+    """
+    info:
+        Upload project context to file storage
+    args:
+        refresh: set to True to force re-upload of context.
+    returns:
+        uploaded file
+    """
+    global CODEBASE_INDEX_FILE
+
+    changed = await CODEBASE_INDEX.update()
+    digest = CODEBASE_INDEX.digest
+
+    if not refresh:
+        # Same tree as the last upload: reuse it, across restarts too
+        if CODEBASE_INDEX_FILE and not changed:
+            try:
+                await async_client.files.get(name=CODEBASE_INDEX_FILE.name)
+                return CODEBASE_INDEX_FILE
+            except Exception as e:
+                LOGGER.error(f"Error accessing uploaded codebase file: {e}\nAuto Refreshing...")
+
+        elif saved_file := await get_saved_upload(digest):
+            CODEBASE_INDEX_FILE = saved_file
+            return CODEBASE_INDEX_FILE
+
+    joined_codebase = CODEBASE_INDEX.build()
 
     codebase = io.BytesIO(bytes(joined_codebase, encoding="utf-8"))
     codebase.name = "codebase_index.txt"
 
     CODEBASE_INDEX_FILE = await utils.upload_file(codebase, codebase.name)
 
+    expiry = CODEBASE_INDEX_FILE.expiration_time
+    await DB_SETTINGS.add_data(
+        {
+            "_id": "gemini_codebase_upload",
+            "name": CODEBASE_INDEX_FILE.name,
+            "expires": expiry.timestamp() if expiry else time.time() + UPLOAD_TTL,
+            "digest": digest,
+        }
+    )
+
     LOGGER.info(
         f"Codebase indexed successfully: [{bytes_to_mb(len(codebase.getvalue()))} MBs] [{len(joined_codebase)} chars]"
+        f" [{changed} files re-processed]"
     )
     return CODEBASE_INDEX_FILE
 
@@ -1,6 +1,5 @@
 import asyncio
 import io
-import os.path
 import pathlib
 import shutil
 import time
@@ -8,10 +7,11 @@ from functools import wraps
 from mimetypes import guess_type
 
 from google.genai.types import File, Part
-from ub_core.utils import get_tg_media_details
+from ub_core.utils import get_filename_from_mime, get_tg_media_details
 
 from app import BOT, Message, extra_config
 from app.plugins.ai.gemini import async_client
+from app.plugins.files.media_cache import download_media
 
 
 def run_basic_check(function):
@@ -55,8 +55,11 @@ async def upload_tg_file(message: Message, check_size: bool = True) -> File:
             file_name = downloaded_file.name
         else:
             download_dir = f"downloads/{time.time()}/"
-            downloaded_file: str = await message.download(download_dir)
-            file_name = os.path.basename(downloaded_file)
+            # Photos carry neither a name nor a mime type
+            file_name = getattr(media, "file_name", None) or get_filename_from_mime(
+                getattr(media, "mime_type", "image/jpeg")
+            )
+            downloaded_file = await download_media(message=message, path=pathlib.Path(download_dir, file_name))
 
         return await upload_file(downloaded_file, file_name)
     finally:
@@ -1,10 +1,18 @@
 import asyncio
+import os
 import time
 from pathlib import Path
 
-from ub_core.utils import Download, DownloadedFile, get_filename_from_mime,get_tg_media_details, progress
+from ub_core.utils import Download, DownloadedFile, get_filename_from_mime, get_tg_media_details
 
 from app import BOT, Message, bot
+from app.plugins.files.jobs import JOBS
+from app.plugins.files.media_cache import download_media
+from app.plugins.files.segmented_download import SegmentedDownload, get_session
+from app.plugins.files.storage import STORAGE
+from app.plugins.files.transfer_progress import PROGRESS
+
+TG_DOWNLOAD_WORKERS = int(os.getenv("TG_DOWNLOAD_WORKERS", 4))
 
 
 @bot.add_cmd(cmd="download")
@@ -12,10 +20,13 @@ async def down_load(bot: BOT, message: Message):
     """
     CMD: DOWNLOAD
     INFO: Download Files/TG Media to Bot server.
-    FLAGS: "-f" for custom filename
+    FLAGS:
+        -f: custom filename
+        -c: download URL | t.me link over N parallel connections
     USAGE:
         .download URL | Reply to Media
         .download -f file.ext URL | Reply to Media
+        .download -c 8 [-f file.ext] URL
     """
     response = await message.reply("Checking Input...")
 
@@ -46,10 +57,15 @@ async def down_load(bot: BOT, message: Message):
 
     else:
 
+        url = message.filtered_input
+        connections = None
+
+        if "-c" in message.flags:
+            connections, url = url.split(maxsplit=1)
+            connections = int(connections)
+
         if "-f" in message.flags:
-            file_name, url = message.filtered_input.split(maxsplit=1)
-        else:
-            url = message.filtered_input
+            file_name, url = url.split(maxsplit=1)
 
         if url.startswith("https://t.me/"):
             download_coro = telegram_download(
@@ -57,6 +73,15 @@ async def down_load(bot: BOT, message: Message):
                 response=response,
                 dir_name=dl_dir_name,
                 file_name=file_name,
+                workers=connections or TG_DOWNLOAD_WORKERS,
+            )
+        elif connections:
+            download_coro = segmented_download(
+                url=url,
+                response=response,
+                dir_name=dl_dir_name,
+                file_name=file_name,
+                connections=connections,
             )
         else:
             dl_obj: Download = await Download.setup(
@@ -65,10 +90,10 @@ async def down_load(bot: BOT, message: Message):
                 message_to_edit=response,
                 custom_file_name=file_name,
             )
-            download_coro = dl_obj.download()
+            download_coro = STORAGE.run(dl_obj.download(), dl_dir_name, dl_obj.size_bytes)
 
     try:
-        downloaded_file: DownloadedFile = await download_coro
+        downloaded_file: DownloadedFile = await JOBS.run("download", message, response, download_coro)
         await response.edit(
             f"<code>{downloaded_file.path}</code>"
             f"\n\n<code>{downloaded_file.size}</code> mb"
@@ -90,14 +115,48 @@ async def down_load(bot: BOT, message: Message):
             await dl_obj.close()
 
 
+async def segmented_download(
+    url: str, response: Message, dir_name: Path, file_name: str | None = None, connections: int = 4
+) -> DownloadedFile:
+    """
+    Fetch url over several Range requests written straight into a preallocated file.
+    Falls back to a single stream when the server doesn't serve byte ranges.
+    """
+    downloader = await SegmentedDownload.from_url(get_session(), url, connections=connections)
+
+    if downloader is None:
+        await response.edit("Server doesn't support ranged downloads, using a single connection...")
+        dl_obj: Download = await Download.setup(
+            url=url, dir=dir_name, message_to_edit=response, custom_file_name=file_name
+        )
+        try:
+            return await STORAGE.run(dl_obj.download(), dir_name, dl_obj.size_bytes)
+        finally:
+            await dl_obj.close()
+
+    file_name = file_name or downloader.file_name or get_filename_from_mime(downloader.mime_type)
+    media_obj: DownloadedFile = DownloadedFile(file=dir_name / file_name, size=downloader.size)
+
+    async with STORAGE.reserve(dir_name, downloader.size):
+        with PROGRESS.track(response, downloader.size, f"Downloading [{connections}x]...", file_name) as transfer:
+            downloader.on_progress = transfer.update
+            await downloader.to_file(media_obj.path)
+    return media_obj
+
+
 async def telegram_download(
-    message: Message, response: Message, dir_name: Path, file_name: str | None = None
+    message: Message,
+    response: Message,
+    dir_name: Path,
+    file_name: str | None = None,
+    workers: int = TG_DOWNLOAD_WORKERS,
 ) -> DownloadedFile:
     """
     :param message: Message Containing Media
     :param response: Response to Edit
     :param dir_name: Download path
     :param file_name: Custom File Name
+    :param workers: Parts fetched in parallel
     :return: DownloadedFile
     """
     tg_media = get_tg_media_details(message)
@@ -106,11 +165,7 @@ async def telegram_download(
 
     media_obj: DownloadedFile = DownloadedFile(file=dir_name / file_name, size=tg_media.file_size)
 
-    progress_args = (response, "Downloading...", media_obj.path)
-
-    await message.download(
-        file_name=media_obj.path,
-        progress=progress,
-        progress_args=progress_args,
-    )
+    async with STORAGE.reserve(dir_name, tg_media.file_size):
+        with PROGRESS.track(response, tg_media.file_size, "Downloading...", file_name) as transfer:
+            await download_media(message=message, path=media_obj.path, workers=workers, on_chunk=transfer.update)
     return media_obj
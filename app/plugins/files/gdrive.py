@@ -1,19 +1,49 @@
 import asyncio
+import hashlib
 import json
 import os
+import re
+import time
+from bisect import bisect_left
 from collections import defaultdict
+from datetime import UTC, datetime, timedelta
 from functools import wraps
+from itertools import islice
+from pathlib import Path
+from urllib.parse import urlencode
 
 import aiohttp
-from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from pyrogram.enums import ParseMode
 from ub_core import BOT, Config, CustomDB, Message, bot
-from ub_core.utils import Download, get_tg_media_details, progress
+from ub_core.utils import Download, bytes_to_mb, get_tg_media_details
+from yarl import URL
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+from app.plugins.files.jobs import JOBS
+from app.plugins.files.segmented_download import STREAM_TIMEOUT, SegmentedDownload
+from app.plugins.files.storage import STORAGE
+from app.plugins.files.tg_stream import MEDIA_CHUNK_SIZE, iter_media_parallel, send_stream
+from app.plugins.files.transfer_progress import PROGRESS, Transfer
 
 DB = CustomDB["COMMON_SETTINGS"]
+INDEX_DB = CustomDB["DRIVE_INDEX"]
+
+API_URL = "https://www.googleapis.com/drive/v3"
+UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3"
+BATCH_URL = "https://www.googleapis.com/batch/drive/v3"
+
+BATCH_ID_REGEX = re.compile(r"Content-ID: <response-item-(\d+)>", re.IGNORECASE)
+
+DRIVE_ID_REGEX = re.compile(r"(?:/d/|/folders/|[?&]id=)([\w-]{20,})")
+
+# 403 reasons that clear up with backoff, every other 403 is a permanent refusal
+RATE_LIMIT_REASONS = {"userRateLimitExceeded", "rateLimitExceeded"}
 
 INSTRUCTIONS = """
 Gdrive Credentials and Access token not found!
@@ -33,40 +63,413 @@ Gdrive Credentials and Access token not found!
 """
 
 
+def file_md5(path: Path) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as file:
+        while chunk := file.read(4194304):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class UploadDigest:
+    """
+    Hashes the bytes Drive has committed while they stream past, so the
+    upload can be checked against Drive's md5Checksum without a re-read.
+
+    Only meaningful when every byte went through it: a session resumed
+    mid-way is reported as unverified.
+    """
+
+    def __init__(self):
+        self.md5 = hashlib.md5()
+        self.xxh3 = xxhash.xxh3_64() if xxhash else None
+        self.size = 0
+        self.valid = True
+
+    def update(self, data: memoryview):
+        self.md5.update(data)
+        if self.xxh3:
+            self.xxh3.update(data)
+        self.size += len(data)
+
+    def verify(self, file: dict) -> bool | None:
+        """
+        :return: True or False if the md5s could be compared, None otherwise.
+        """
+        if not self.valid or "md5Checksum" not in file:
+            return None
+        return self.md5.hexdigest() == file["md5Checksum"]
+
+    def summary(self, file: dict) -> str:
+        status = {True: "verified", False: "MISMATCH", None: "not verified"}[self.verify(file)]
+        text = f"<b>MD5</b>: <code>{file.get('md5Checksum', '-')}</code> [{status}]"
+        if self.xxh3 and self.valid:
+            text += f"\n<b>XXH3</b>: <code>{self.xxh3.hexdigest()}</code>"
+        return text
+
+
+class DriveError(Exception):
+    def __init__(self, status: int, text: str):
+        super().__init__(text)
+        self.status = status
+
+    @property
+    def is_retryable(self) -> bool:
+        return self.status >= 500 or self.status in (408, 429)
+
+
+class DriveUploadError(DriveError):
+    pass
+
+
+def is_rate_limited(body: dict) -> bool:
+    """Whether a Drive error body names a rate limit reason."""
+    errors = body.get("error", {}).get("errors", []) if isinstance(body, dict) else []
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+
+async def skip_bytes(chunk_iter, skip: int):
+    """Drop the first skip bytes from an async chunk iterator."""
+    async for chunk in chunk_iter:
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        if skip:
+            chunk = chunk[skip:]
+            skip = 0
+        yield chunk
+
+
+class ChunkAssembler:
+    """
+    Collects streamed bytes into two reusable buffers and hands out
+    zero-copy views of full Drive chunks: one buffer fills while the
+    chunk taken from the other is being PUT.
+
+    Chunk size starts at the 256 KiB Drive alignment and doubles while PUTs
+    finish well under TARGET_PUT_TIME, shrinking again on slow PUTs.
+    Sizes always stay multiples of ALIGNMENT, Drive rejects anything else
+    but the last chunk.
+    """
+
+    ALIGNMENT = 262144
+    TARGET_PUT_TIME = 4
+
+    def __init__(self, max_size: int):
+        self.max_size = max(self.ALIGNMENT, max_size // self.ALIGNMENT * self.ALIGNMENT)
+        self.chunk_size = self.ALIGNMENT
+        self.filled = 0
+        self._buffers = [bytearray(self.chunk_size), bytearray(self.chunk_size)]
+        self._view = memoryview(self._buffers[0])
+
+    @property
+    def is_full(self) -> bool:
+        return self.filled == len(self._view)
+
+    @property
+    def view(self) -> memoryview:
+        return self._view[: self.filled]
+
+    def feed(self, data: memoryview) -> int:
+        """Copy as much of data as fits into the buffer and return the number of bytes taken."""
+        taken = min(len(data), len(self._view) - self.filled)
+        self._view[self.filled : self.filled + taken] = data[:taken]
+        self.filled += taken
+        return taken
+
+    def take(self) -> memoryview:
+        """
+        Hand out the filled chunk and continue in the other buffer,
+        whose previous chunk must be done being PUT.
+        """
+        chunk = self.view
+        self._buffers.reverse()
+        if len(self._buffers[0]) != self.chunk_size:
+            # Replaced, not resized: the old buffer may still be exported
+            self._buffers[0] = bytearray(self.chunk_size)
+        self._view = memoryview(self._buffers[0])
+        self.filled = 0
+        return chunk
+
+    def adapt(self, put_size: int, put_time: float):
+        """Size the next chunks after the measured PUT speed."""
+        if put_size < self.chunk_size:
+            return
+
+        if put_time < self.TARGET_PUT_TIME / 2:
+            self.chunk_size = min(self.chunk_size * 2, self.max_size)
+        elif put_time > self.TARGET_PUT_TIME * 2:
+            self.chunk_size = max(self.chunk_size // 2 // self.ALIGNMENT * self.ALIGNMENT, self.ALIGNMENT)
+
+
+class DriveIndex:
+    """
+    In-memory copy of Drive metadata, persisted in DRIVE_INDEX and kept
+    current through the changes.list page token API.
+    """
+
+    KEYS = ("id", "name", "parents", "mimeType", "size", "md5Checksum", "shortcutDetails")
+    FIELDS = ", ".join(KEYS)
+
+    def __init__(self, drive: "Drive"):
+        self.drive = drive
+        self.entries: dict[str, dict] = {}
+        self.children: dict[str, set[str]] = defaultdict(set)
+        self.root_id: str | None = None
+        self.page_token: str | None = None
+        self.is_ready = False
+        self._sorted_names: list[tuple[str, str]] = []
+        self._names_dirty = True
+        self._lock = asyncio.Lock()
+
+    def _add(self, file: dict):
+        self._remove(file["id"])
+        entry = {key: file[key] for key in self.KEYS if key in file}
+        self.entries[file["id"]] = entry
+        for parent in entry.get("parents", []):
+            self.children[parent].add(file["id"])
+        self._names_dirty = True
+
+    def add_file(self, file: dict):
+        """List a file the bot itself made right away, instead of after the next sync."""
+        if self.is_ready and file and "parents" in file and "mimeType" in file:
+            self._add(file)
+
+    def _remove(self, file_id: str):
+        entry = self.entries.pop(file_id, None)
+        if not entry:
+            return
+        for parent in entry.get("parents", []):
+            self.children[parent].discard(file_id)
+        self._names_dirty = True
+
+    async def load(self):
+        async with self._lock:
+            state = await DB.find_one({"_id": "drive_index_state"})
+            if state:
+                self.root_id = state["root_id"]
+                self.page_token = state["page_token"]
+                async for file in INDEX_DB.find():
+                    self._add(file)
+            else:
+                await self._bootstrap()
+            self.is_ready = True
+            bot.log.info(f"Drive index ready: {len(self.entries)} entries")
+
+    async def rebuild(self):
+        async with self._lock:
+            await self._clear()
+            await self._bootstrap()
+            self.is_ready = True
+
+    async def reset(self):
+        async with self._lock:
+            await self._clear()
+            await DB.delete_data({"_id": "drive_index_state"})
+
+    async def _clear(self):
+        self.is_ready = False
+        self.entries.clear()
+        self.children.clear()
+        self._names_dirty = True
+        await INDEX_DB.drop()
+
+    async def _bootstrap(self):
+        # Take the token first so changes made while listing are replayed by sync
+        token = await self.drive.request("GET", "changes/startPageToken")
+        root = await self.drive.get_file("root", fields="id")
+
+        docs = []
+        params = {"q": "trashed=false", "pageSize": 1000, "fields": f"nextPageToken, files({self.FIELDS})"}
+        while True:
+            result = await self.drive.request("GET", "files", params=params)
+            for file in result.get("files", []):
+                self._add(file)
+                docs.append({"_id": file["id"], **self.entries[file["id"]]})
+            if not (page_token := result.get("nextPageToken")):
+                break
+            params["pageToken"] = page_token
+
+        for i in range(0, len(docs), 1000):
+            await INDEX_DB.insert_many(docs[i : i + 1000])
+
+        self.root_id = root["id"]
+        self.page_token = token["startPageToken"]
+        await DB.add_data({"_id": "drive_index_state", "root_id": self.root_id, "page_token": self.page_token})
+
+    async def sync(self):
+        if not self.is_ready or self._lock.locked():
+            return
+
+        async with self._lock:
+            fields = f"nextPageToken, newStartPageToken, changes(fileId, removed, file({self.FIELDS}, trashed))"
+            page_token = self.page_token
+            while page_token:
+                result = await self.drive.request(
+                    "GET", "changes", params={"pageToken": page_token, "pageSize": 1000, "fields": fields}
+                )
+                for change in result.get("changes", []):
+                    file = change.get("file")
+                    if change.get("removed") or not file or file.get("trashed"):
+                        self._remove(change["fileId"])
+                        await INDEX_DB.delete_data({"_id": change["fileId"]})
+                    else:
+                        self._add(file)
+                        await INDEX_DB.add_data({"_id": file["id"], **self.entries[file["id"]]})
+
+                if new_token := result.get("newStartPageToken"):
+                    self.page_token = new_token
+                    break
+                page_token = result.get("nextPageToken")
+
+            await DB.add_data({"_id": "drive_index_state", "root_id": self.root_id, "page_token": self.page_token})
+
+    def search(
+        self,
+        _id: bool = False,
+        limit: int = 10,
+        file_only: bool = False,
+        folder_only: bool = False,
+        search_param: str | None = None,
+    ) -> list[dict]:
+        if search_param is None or _id:
+            parent = search_param or self.drive.DRIVE_ROOT_ID
+            if parent == "root":
+                parent = self.root_id
+            candidates = sorted(
+                (self.entries[file_id] for file_id in self.children.get(parent, ())), key=self._sort_key
+            )
+        else:
+            candidates = self._name_matches(search_param.lower())
+
+        results = []
+        for entry in candidates:
+            is_folder = entry["mimeType"] == self.drive.FOLDER_MIME
+            if (folder_only and not is_folder) or (file_only and is_folder):
+                continue
+            results.append(entry)
+            if len(results) >= limit:
+                break
+        return sorted(results, key=self._sort_key)
+
+    def _sort_key(self, entry: dict) -> tuple[bool, str]:
+        # Folders first, then by name, like Drive's orderBy=folder,name
+        return entry["mimeType"] != self.drive.FOLDER_MIME, entry["name"].lower()
+
+    def _name_matches(self, query: str):
+        """Yield prefix matches first, then the remaining substring matches."""
+        if self._names_dirty:
+            self._sorted_names = sorted((entry["name"].lower(), file_id) for file_id, entry in self.entries.items())
+            self._names_dirty = False
+
+        prefix_ids = set()
+        for name, file_id in islice(self._sorted_names, bisect_left(self._sorted_names, (query,)), None):
+            if not name.startswith(query):
+                break
+            prefix_ids.add(file_id)
+            yield self.entries[file_id]
+
+        for name, file_id in self._sorted_names:
+            if file_id not in prefix_ids and query in name:
+                yield self.entries[file_id]
+
+
 class Drive:
     URL_TEMPLATE = "https://drive.google.com/file/d/{media_id}/view?usp=sharing"
+    FOLDER_URL_TEMPLATE = "https://drive.google.com/drive/folders/{media_id}"
     FOLDER_MIME = "application/vnd.google-apps.folder"
     SHORTCUT_MIME = "application/vnd.google-apps.shortcut"
     DRIVE_ROOT_ID = os.getenv("DRIVE_ROOT_ID", "root")
+    UPLOAD_CHUNK_SIZE = 524288
+    # Concurrent Telegram segment fetches per upload
+    TG_WORKERS = int(os.getenv("DRIVE_TG_WORKERS", 4))
+    FILE_READ_SIZE = 4194304
+    # Drive caps batch requests at 100 calls
+    BATCH_SIZE = 100
+    CLONE_CONCURRENCY = 4
+    # Seconds before expiry at which the access token is renewed
+    TOKEN_REFRESH_MARGIN = 300
+    CONNECTIONS_PER_HOST = int(os.getenv("DRIVE_CONNECTIONS_PER_HOST", 16))
+    MAX_RETRIES = 5
+    # Re-uploads after an md5 mismatch before giving up
+    VERIFY_RETRIES = 2
+    # Seconds between persisting an upload session's committed offset
+    SESSION_SAVE_INTERVAL = 10
+    # Ceiling for adaptive resumable PUT size, in MiB
+    MAX_CHUNK_SIZE = int(os.getenv("DRIVE_MAX_CHUNK_SIZE", 64)) * 1048576
+    # Max source chunks queued while both chunk buffers are taken
+    PIPELINE_QUEUE_SIZE = int(os.getenv("DRIVE_PIPELINE_QUEUE_SIZE", 16))
 
     def __init__(self):
         self._aiohttp_session = None
-        self._progress_store: dict[str, dict[str, str | int | asyncio.Task]] = defaultdict(dict)
         self._creds: Credentials | None = None
-        self.service = None
-        self.files = None
+        self._bearer: str = ""
+        self._token_expires_at: float = 0
+        self._refresh_task: asyncio.Task | None = None
+        self._refresh_worker: asyncio.Task | None = None
         self.is_authenticated = False
+        self.index = DriveIndex(self)
+        self._index_task: asyncio.Task | None = None
+        # Upload sessions being written right now, .gresume leaves them alone
+        self.active_sessions: set[str] = set()
 
     async def async_init(self):
         if self._aiohttp_session is None:
-            self._aiohttp_session = aiohttp.ClientSession()
+            connector = aiohttp.TCPConnector(limit=100, limit_per_host=self.CONNECTIONS_PER_HOST, keepalive_timeout=60)
+            self._aiohttp_session = aiohttp.ClientSession(connector=connector)
             Config.TASK_MANAGER.add_exit(self._aiohttp_session.close)
         await self.set_creds()
 
     @property
     def creds(self):
-        if isinstance(self._creds, Credentials) and self._creds.expired and self._creds.refresh_token:
-            self._creds.refresh(Request())
-            asyncio.run_coroutine_threadsafe(
-                coro=DB.add_data({"_id": "drive_creds", "creds": json.loads(self._creds.to_json())}),
-                loop=bot.loop,
-            )
-            bot.log.info("Gdrive Creds Auto-Refreshed")
         return self._creds
 
     @creds.setter
-    def creds(self, creds):
+    def creds(self, creds: Credentials):
         self._creds = creds
+        self._bearer = f"Bearer {creds.token}"
+        # google-auth keeps expiry as naive UTC
+        self._token_expires_at = creds.expiry.replace(tzinfo=UTC).timestamp() if creds.expiry else 0
+
+    async def bearer(self) -> str:
+        """Cached Authorization header value, refreshed only when close to expiry."""
+        if time.time() > self._token_expires_at - self.TOKEN_REFRESH_MARGIN:
+            await self.refresh_token()
+        return self._bearer
+
+    async def refresh_token(self):
+        # Single-flight: concurrent callers await the same refresh
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_token(), name="drive_token_refresh")
+        await asyncio.shield(self._refresh_task)
+
+    async def _refresh_token(self):
+        creds = self._creds
+        data = {
+            "client_id": creds.client_id,
+            "client_secret": creds.client_secret,
+            "refresh_token": creds.refresh_token,
+            "grant_type": "refresh_token",
+        }
+        async with self._aiohttp_session.post(creds.token_uri, data=data) as resp:
+            if resp.status != 200:
+                raise DriveError(resp.status, f"Token refresh failed: {await resp.text()}")
+            result = await resp.json()
+
+        creds.token = result["access_token"]
+        creds.expiry = datetime.now(UTC).replace(tzinfo=None) + timedelta(seconds=result["expires_in"])
+        self.creds = creds
+        await DB.add_data({"_id": "drive_creds", "creds": json.loads(creds.to_json())})
+        bot.log.info("Gdrive Creds Auto-Refreshed")
+
+    async def _token_refresh_worker(self):
+        while self.is_authenticated:
+            await asyncio.sleep(max(self._token_expires_at - self.TOKEN_REFRESH_MARGIN - time.time(), 0))
+            try:
+                await self.refresh_token()
+            except Exception as e:
+                bot.log.error(f"Gdrive token refresh failed: {e}")
+                await asyncio.sleep(30)
 
     async def set_creds(self):
         cred_data = await DB.find_one({"_id": "drive_creds"})
@@ -77,15 +480,16 @@ class Drive:
         self.creds = Credentials.from_authorized_user_info(
             info=cred_data["creds"], scopes=["https://www.googleapis.com/auth/drive"]
         )
-        self.service = build(
-            serviceName="drive",
-            version="v3",
-            credentials=self.creds,
-            cache_discovery=False,
-        )
-        self.files = self.service.files()
         self.is_authenticated = True
 
+        if self._refresh_worker is not None:
+            self._refresh_worker.cancel()
+        if self.creds.refresh_token:
+            self._refresh_worker = asyncio.create_task(self._token_refresh_worker(), name="drive_token_worker")
+
+        if not self.index.is_ready and (self._index_task is None or self._index_task.done()):
+            self._index_task = asyncio.create_task(self.index.load(), name="drive_index_load")
+
     def ensure_creds(self, func):
         @wraps(func)
         async def inner(bot: BOT, message: Message):
@@ -103,6 +507,7 @@ class Drive:
         file_only: bool = False,
         folder_only: bool = False,
         search_param: str | None = None,
+        remote: bool = False,
     ) -> list[dict[str, str | int]]:
         """
         :param _id: The ID of the folder to list files from.
@@ -110,9 +515,186 @@ class Drive:
         :param file_only: If True, only list files.
         :param folder_only: If True, only list folders.
         :param search_param: A string to search for in file/folder names.
+        :param remote: If True, skip the local index and query Drive.
         :return: A list of dictionaries containing file/folder id, name and mimeType.
         """
-        return await asyncio.to_thread(self._list, _id, limit, file_only, folder_only, search_param)
+        if self.index.is_ready and not remote:
+            return self.index.search(_id, limit, file_only, folder_only, search_param)
+        return await self._list(_id, limit, file_only, folder_only, search_param)
+
+    async def request(
+        self, method: str, path: str, params: dict = None, json: dict = None, base: str = API_URL
+    ) -> dict:
+        """
+        :param path: Endpoint relative to base, e.g. files/{id}/copy.
+        :return: Decoded JSON response, empty for 204s.
+        """
+        headers = {"Authorization": await self.bearer()}
+        url = f"{base}/{path}"
+        async with self._aiohttp_session.request(method, url, params=params, json=json, headers=headers) as resp:
+            if resp.status >= 400:
+                raise DriveError(resp.status, f"{method} {path} failed with {resp.status}: {await resp.text()}")
+            if resp.status == 204:
+                return {}
+            return await resp.json()
+
+    async def get_file(self, file_id: str, fields: str = "id, name, mimeType, size, md5Checksum") -> dict:
+        return await self.request("GET", f"files/{file_id}", params={"fields": fields})
+
+    async def create_folder(self, name: str, parent_id: str = None) -> dict:
+        folder = await self.request(
+            "POST",
+            "files",
+            params={"fields": DriveIndex.FIELDS},
+            json={"name": name, "mimeType": self.FOLDER_MIME, "parents": [parent_id or self.DRIVE_ROOT_ID]},
+        )
+        self.index.add_file(folder)
+        return folder
+
+    async def copy_file(self, file_id: str, parent_id: str = None, name: str = None) -> dict:
+        body = {"parents": [parent_id or self.DRIVE_ROOT_ID]}
+        if name:
+            body["name"] = name
+        copy = await self.request("POST", f"files/{file_id}/copy", params={"fields": DriveIndex.FIELDS}, json=body)
+        self.index.add_file(copy)
+        return copy
+
+    async def delete_file(self, file_id: str):
+        await self.request("DELETE", f"files/{file_id}")
+
+    async def add_permission(self, file_id: str, role: str = "reader", _type: str = "anyone") -> dict:
+        return await self.request("POST", f"files/{file_id}/permissions", json={"role": role, "type": _type})
+
+    async def batch(self, requests: list[dict]) -> list[tuple[int, dict]]:
+        """
+        Send up to BATCH_SIZE requests in one multipart/mixed call.
+
+        :param requests: dicts with method, path and optional params and json.
+        :return: (status, body) for every request, in order.
+        """
+        boundary = f"batch_{time.time_ns()}"
+        parts = []
+        for index, request in enumerate(requests):
+            path = f"/drive/v3/{request['path']}"
+            if params := request.get("params"):
+                path += f"?{urlencode(params)}"
+            body = json.dumps(request["json"]) if "json" in request else ""
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <item-{index}>\r\n\r\n"
+                f"{request['method']} {path}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{body}\r\n"
+            )
+        payload = "".join(parts) + f"--{boundary}--"
+
+        headers = {"Authorization": await self.bearer(), "Content-Type": f"multipart/mixed; boundary={boundary}"}
+        async with self._aiohttp_session.post(BATCH_URL, data=payload.encode(), headers=headers) as resp:
+            if resp.status >= 400:
+                raise DriveError(resp.status, f"Batch request failed with {resp.status}: {await resp.text()}")
+            response_boundary = resp.headers["Content-Type"].split("boundary=", 1)[1].strip('"')
+            text = await resp.text()
+
+        results: list[tuple[int, dict]] = [(0, {})] * len(requests)
+        for part in text.split(f"--{response_boundary}"):
+            part_headers, _, http_response = part.strip().partition("\r\n\r\n")
+            if not (match := BATCH_ID_REGEX.search(part_headers)):
+                continue
+            status_line, _, rest = http_response.partition("\r\n")
+            body = rest.partition("\r\n\r\n")[2].strip()
+            results[int(match.group(1))] = (int(status_line.split()[1]), json.loads(body) if body else {})
+        return results
+
+    async def clone(self, file_ref: str, folder_id: str = None) -> str:
+        """
+        Server-side copy of a file or a whole folder tree into folder_id.
+        No file content passes through the bot.
+        """
+        try:
+            fields = "id, name, mimeType, shortcutDetails"
+            meta = await self.get_file(self.parse_id(file_ref), fields=fields)
+            if meta["mimeType"] == self.SHORTCUT_MIME:
+                meta = await self.get_file(meta["shortcutDetails"]["targetId"], fields=fields)
+
+            if meta["mimeType"] != self.FOLDER_MIME:
+                copy = await self.copy_file(meta["id"], folder_id)
+                return f"Cloned: <a href={self.URL_TEMPLATE.format(media_id=copy['id'])}>{copy['name']}</a>"
+
+            counts = defaultdict(int)
+            semaphore = asyncio.Semaphore(self.CLONE_CONCURRENCY)
+            start_time = time.perf_counter()
+            new_id = await self._clone_folder(meta, folder_id, semaphore, counts)
+            return (
+                f"Cloned: <a href={self.FOLDER_URL_TEMPLATE.format(media_id=new_id)}>{meta['name']}</a>"
+                f"\n\nFiles: <b>{counts['files']}</b>"
+                f"\nFolders: <b>{counts['folders']}</b>"
+                f"\nFailed: <b>{counts['failed']}</b>"
+                f"\n\nTook <code>{time.perf_counter() - start_time:.1f}</code>s"
+            )
+        except Exception as e:
+            return f"Error:\n{e}"
+
+    async def _clone_folder(self, folder: dict, parent_id: str | None, semaphore: asyncio.Semaphore, counts) -> str:
+        async with semaphore:
+            new_id = (await self.create_folder(folder["name"], parent_id))["id"]
+            params = {
+                "q": f"'{folder['id']}' in parents and trashed=false",
+                "pageSize": 1000,
+                "fields": "nextPageToken, files(id, name, mimeType)",
+            }
+            children = []
+            while True:
+                result = await self.request("GET", "files", params=params)
+                children.extend(result.get("files", []))
+                if not (page_token := result.get("nextPageToken")):
+                    break
+                params["pageToken"] = page_token
+        counts["folders"] += 1
+
+        files = [child for child in children if child["mimeType"] != self.FOLDER_MIME]
+        sub_folders = [child for child in children if child["mimeType"] == self.FOLDER_MIME]
+
+        await asyncio.gather(
+            *[
+                self._batch_copy(files[i : i + self.BATCH_SIZE], new_id, semaphore, counts)
+                for i in range(0, len(files), self.BATCH_SIZE)
+            ],
+            *[self._clone_folder(sub_folder, new_id, semaphore, counts) for sub_folder in sub_folders],
+        )
+        return new_id
+
+    async def _batch_copy(self, files: list[dict], parent_id: str, semaphore: asyncio.Semaphore, counts):
+        for attempt in range(self.MAX_RETRIES + 1):
+            requests = [
+                {
+                    "method": "POST",
+                    "path": f"files/{file['id']}/copy",
+                    "params": {"fields": DriveIndex.FIELDS},
+                    "json": {"name": file["name"], "parents": [parent_id]},
+                }
+                for file in files
+            ]
+            async with semaphore:
+                results = await self.batch(requests)
+
+            # Retry only the items Drive rate limited or failed on
+            retry = []
+            for file, (status, body) in zip(files, results):
+                is_retryable = status >= 500 or status == 429 or (status == 403 and is_rate_limited(body))
+                if status in (200, 201):
+                    counts["files"] += 1
+                    self.index.add_file(body)
+                elif is_retryable and attempt < self.MAX_RETRIES:
+                    retry.append(file)
+                else:
+                    counts["failed"] += 1
+                    bot.log.error(f"Drive clone failed for {file['name']}: {status} {body}")
+
+            if not retry:
+                return
+            files = retry
+            await asyncio.sleep(min(2**attempt, 60))
 
     async def upload_from_url(
         self,
@@ -122,17 +704,14 @@ class Drive:
         message_to_edit: Message = None,
     ):
         try:
-            file_id = await self._upload_from_url(file_url, is_encoded, folder_id, message_to_edit)
-            if file_id is not None:
-                return self.URL_TEMPLATE.format(media_id=file_id)
+            with PROGRESS.track(message_to_edit, 0, "Uploading to Drive...") as transfer:
+                file, digest = await self._upload_verified(
+                    lambda _digest: self._upload_from_url(file_url, is_encoded, folder_id, transfer, _digest),
+                    transfer,
+                )
+            return self.upload_result(file, digest)
         except Exception as e:
             return f"Error:\n{e}"
-        finally:
-            store = self._progress_store.pop(file_url, {})
-            store["done"] = True
-            task = store.get("edit_task")
-            if isinstance(task, asyncio.Task):
-                task.cancel()
 
     async def upload_from_telegram(
         self,
@@ -141,19 +720,40 @@ class Drive:
         folder_id: str = None,
     ):
         try:
-            file_id = await self._upload_from_telegram(media_message, message_to_edit, folder_id)
-            if file_id is not None:
-                return self.URL_TEMPLATE.format(media_id=file_id)
+            with PROGRESS.track(message_to_edit, 0, "Uploading to Drive...") as transfer:
+                file, digest = await self._upload_verified(
+                    lambda _digest: self._upload_from_telegram(
+                        media_message, message_to_edit, folder_id, transfer, _digest
+                    ),
+                    transfer,
+                )
+            return self.upload_result(file, digest)
         except Exception as e:
             return f"Error:\n{e}"
-        finally:
-            store = self._progress_store.pop(message_to_edit.task_id, {})
-            store["done"] = True
-            task = store.get("edit_task")
-            if isinstance(task, asyncio.Task):
-                task.cancel()
 
-    def _list(
+    async def _upload_verified(self, upload, transfer: Transfer) -> tuple[dict, UploadDigest]:
+        """
+        Run upload with a fresh digest and re-upload when Drive's md5 doesn't match.
+
+        :param upload: Coroutine function taking an UploadDigest and returning the Drive file.
+        """
+        for attempt in range(self.VERIFY_RETRIES + 1):
+            digest = UploadDigest()
+            file = await upload(digest)
+            if digest.verify(file) is not False or attempt == self.VERIFY_RETRIES:
+                self.index.add_file(file)
+                return file, digest
+            bot.log.error(f"Drive md5 mismatch for {file.get('name')}, re-uploading...")
+            await self.delete_file(file["id"])
+            transfer.current -= digest.size
+
+    def upload_result(self, file: dict, digest: UploadDigest | None = None) -> str:
+        link = self.URL_TEMPLATE.format(media_id=file["id"])
+        if digest is None:
+            return f"{link}\n\n<b>MD5</b>: <code>{file.get('md5Checksum', '-')}</code>"
+        return f"{link}\n\n{digest.summary(file)}"
+
+    async def _list(
         self,
         _id: bool = False,
         limit: int = 10,
@@ -176,21 +776,22 @@ class Drive:
         else:
             query_params.append(f"'{self.DRIVE_ROOT_ID}' in parents")
 
-        query = " and ".join(query_params)
+        params = {
+            "q": " and ".join(query_params),
+            "fields": "nextPageToken, files(id, name, mimeType, shortcutDetails)",
+            "orderBy": "folder,name",
+        }
 
         files = []
 
-        fields = "nextPageToken, files(id, name, mimeType, shortcutDetails)"
-        result = self.files.list(q=query, pageSize=limit, fields=fields).execute()
-        files.extend(result.get("files", []))
+        while len(files) < limit:
+            params["pageSize"] = limit - len(files)
+            result = await self.request("GET", "files", params=params)
+            files.extend(result.get("files", []))
 
-        while next_token := result.get("nextPageToken"):
-            if len(files) >= limit:
+            if not (next_token := result.get("nextPageToken")):
                 break
-            else:
-                file_limit = limit - len(files)
-            result = self.files.list(q=query, pageSize=file_limit, fields=fields, pageToken=next_token).execute()
-            files.extend(result.get("files", []))
+            params["pageToken"] = next_token
 
         return files[0:limit]
 
@@ -199,12 +800,12 @@ class Drive:
         :return: An url pointing to a location in drive.
         """
         headers = {
-            "Authorization": f"Bearer {self.creds.token}",
+            "Authorization": await self.bearer(),
             "Content-Type": "application/json",
             "X-Upload-Content-Type": "application/octet-stream",
         }
         async with self._aiohttp_session.post(
-            url="https://www.googleapis.com/upload/drive/v3/files?uploadType=resumable",
+            url=f"{UPLOAD_URL}/files?uploadType=resumable&fields={','.join(DriveIndex.KEYS)}",
             json={"name": file_name, "parents": [folder_id or self.DRIVE_ROOT_ID]},
             headers=headers,
         ) as resp:
@@ -213,115 +814,507 @@ class Drive:
                 raise Exception(f"Initiate failed: {text}")
             return resp.headers["Location"]
 
-    async def upload_chunk(self, location, headers, chunk) -> str | None:
+    async def upload_chunk(self, location, headers, chunk) -> dict | None:
         async with self._aiohttp_session.put(location, headers=headers, data=chunk) as put:
             if put.status == 308:
                 # Chunk accepted, not finished yet
                 return None
             elif put.status in (200, 201):
                 # File finished
-                file = await put.json()
-                return file["id"]
+                return await put.json()
             else:
                 text = await put.text()
-                raise Exception(f"Chunk upload failed with {put.status}: {text}")
+                raise DriveUploadError(put.status, f"Chunk upload failed with {put.status}: {text}")
+
+    async def query_upload_status(self, location: str, total_size: int) -> int | dict:
+        """
+        :return: Number of bytes Drive has committed, or the file if the upload already completed.
+        """
+        headers = {"Content-Range": f"bytes */{total_size or '*'}", "Authorization": await self.bearer()}
+        async with self._aiohttp_session.put(location, headers=headers, data=b"") as resp:
+            if resp.status in (200, 201):
+                return await resp.json()
+            if resp.status != 308:
+                raise DriveUploadError(resp.status, f"Upload session lost ({resp.status}): {await resp.text()}")
+            committed = resp.headers.get("Range")
+            return int(committed.rsplit("-", 1)[1]) + 1 if committed else 0
+
+    async def new_session(self, file_name: str, size: int, folder_id: str | None, source: dict) -> dict:
+        session = {
+            "_id": f"drive_upload_{time.time_ns()}",
+            "type": "drive_upload_session",
+            "location": await self.create_file(file_name, folder_id),
+            "file_name": file_name,
+            "size": size,
+            "offset": 0,
+            "source": source,
+        }
+        await DB.add_data(session)
+        return session
+
+    async def resume_session(self, session: dict, message_to_edit: Message = None):
+        try:
+            committed = await self.query_upload_status(session["location"], session["size"])
+            if isinstance(committed, dict):
+                file = committed
+                await DB.delete_data({"_id": session["_id"]})
+            else:
+                session["offset"] = committed
+                with PROGRESS.track(
+                    message_to_edit, session["size"], "Resuming Drive upload...", session["file_name"]
+                ) as transfer:
+                    transfer.current = committed
+                    file = await self._run_session(session, transfer)
+
+            self.index.add_file(file)
+            # Bytes sent before the interruption never went through a digest
+            return self.upload_result(file)
+        except DriveUploadError as e:
+            if e.status in (404, 410):
+                # Drive expired the session, nothing left to resume
+                await DB.delete_data({"_id": session["_id"]})
+            return f"Error:\n{e}"
+        except Exception as e:
+            return f"Error:\n{e}"
+
+    async def upload_folder(
+        self,
+        path: Path,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+        workers: int = 4,
+    ) -> str:
+        """
+        Mirror a local directory tree into Drive.
+        Files whose name, size and md5 match a file in the matching Drive folder are skipped.
+        """
+        if not path.is_dir():
+            return f"Error:\n{path} is not a directory."
+
+        files = [file for file in sorted(path.rglob("*")) if file.is_file()]
+        total_size = sum(file.stat().st_size for file in files)
+
+        try:
+            async with STORAGE.hold(path):
+                with PROGRESS.track(message_to_edit, total_size, "Uploading folder to Drive...", path.name) as transfer:
+                    return await self._upload_folder(path, files, folder_id, workers, transfer)
+        except Exception as e:
+            return f"Error:\n{e}"
+
+    async def _upload_folder(
+        self, path: Path, files: list[Path], folder_id: str | None, workers: int, transfer: Transfer
+    ) -> str:
+        folder_ids = {path: await self.find_or_create_folder(path.name, folder_id)}
+        for sub_dir in sorted(p for p in path.rglob("*") if p.is_dir()):
+            folder_ids[sub_dir] = await self.find_or_create_folder(sub_dir.name, folder_ids[sub_dir.parent])
+
+        remote_files = dict(
+            zip(folder_ids.values(), await asyncio.gather(*[self.list_md5s(_id) for _id in folder_ids.values()]))
+        )
+
+        semaphore = asyncio.Semaphore(workers)
+        counts = defaultdict(int)
+        start_time = time.perf_counter()
+
+        async def upload(file: Path):
+            parent_id = folder_ids[file.parent]
+            async with semaphore:
+                try:
+                    # Only hash files that have a same name and size candidate remotely
+                    remote_md5s = remote_files[parent_id].get((file.name, file.stat().st_size))
+                    if remote_md5s and await asyncio.to_thread(file_md5, file) in remote_md5s:
+                        counts["skipped"] += 1
+                        transfer.total -= file.stat().st_size
+                        return
+
+                    async def upload_file(digest: UploadDigest) -> dict:
+                        session = await self.new_session(
+                            file_name=file.name,
+                            size=file.stat().st_size,
+                            folder_id=parent_id,
+                            source={"type": "file", "path": str(file.resolve())},
+                        )
+                        return await self._run_session(session, transfer, digest=digest)
+
+                    uploaded, digest = await self._upload_verified(upload_file, transfer)
+                    counts["uploaded" if digest.verify(uploaded) is not False else "mismatch"] += 1
+                except Exception as e:
+                    counts["failed"] += 1
+                    bot.log.error(f"Drive folder upload failed for {file}: {e}")
+
+        await asyncio.gather(*[upload(file) for file in files])
+
+        elapsed = time.perf_counter() - start_time
+        speed = bytes_to_mb(transfer.current / elapsed) if elapsed else 0
+        return (
+            f"<a href={self.FOLDER_URL_TEMPLATE.format(media_id=folder_ids[path])}>{path.name}</a>"
+            f"\n\nUploaded: <b>{counts['uploaded']}</b>"
+            f"\nSkipped (same md5): <b>{counts['skipped']}</b>"
+            f"\nMD5 mismatch: <b>{counts['mismatch']}</b>"
+            f"\nFailed: <b>{counts['failed']}</b>"
+            f"\n\n<code>{bytes_to_mb(transfer.current)}</code> mb in <code>{elapsed:.1f}</code>s"
+            f" [<code>{speed}</code> mb/s]"
+        )
+
+    async def find_or_create_folder(self, name: str, parent_id: str = None) -> str:
+        escaped_name = name.replace("\\", "\\\\").replace("'", "\\'")
+        query = (
+            f"'{parent_id or self.DRIVE_ROOT_ID}' in parents and name = '{escaped_name}'"
+            f" and mimeType = '{self.FOLDER_MIME}' and trashed=false"
+        )
+        result = await self.request("GET", "files", params={"q": query, "pageSize": 1, "fields": "files(id)"})
+        if result.get("files"):
+            return result["files"][0]["id"]
+        return (await self.create_folder(name, parent_id))["id"]
+
+    async def list_md5s(self, folder_id: str) -> dict[tuple[str, int], set[str]]:
+        """
+        :return: md5s of the files directly in folder_id, keyed by (name, size).
+        """
+        params = {
+            "q": f"'{folder_id}' in parents and trashed=false",
+            "pageSize": 1000,
+            "fields": "nextPageToken, files(name, size, md5Checksum)",
+        }
+        md5s = defaultdict(set)
+        while True:
+            result = await self.request("GET", "files", params=params)
+            for file in result.get("files", []):
+                if "md5Checksum" in file:
+                    md5s[(file["name"], int(file.get("size", 0)))].add(file["md5Checksum"])
+            if not (page_token := result.get("nextPageToken")):
+                return md5s
+            params["pageToken"] = page_token
 
     async def _upload_from_url(
         self,
         file_url: str,
         is_encoded: bool = False,
         folder_id: str = None,
-        message_to_edit: Message = None,
-    ):
+        transfer: Transfer = None,
+        digest: UploadDigest = None,
+    ) -> dict:
         async with Download(url=file_url, dir="", is_encoded_url=is_encoded) as downloader:
-            store = self._progress_store[file_url]
-            store["size"] = downloader.size_bytes
-            store["done"] = False
-            store["uploaded_size"] = 0
-            store["edit_task"] = asyncio.create_task(
-                self.progress_worker(store, message_to_edit), name="url_drive_up_prog"
-            )
+            transfer.total = downloader.size_bytes
+            transfer.file_name = downloader.file_name
 
             file_session = downloader.file_response_session
             file_session.raise_for_status()
-            drive_location = await self.create_file(downloader.file_name, folder_id)
-            start = 0
-            buffer = b""
-            chunk_size = 524288
-
-            async for chunk in downloader.iter_chunks(chunk_size):
-                buffer += chunk
-                if len(buffer) < chunk_size:
-                    continue
-                else:
-                    chunk = buffer[:chunk_size]
-                    end = start + len(chunk) - 1
-                    put_headers = {
-                        "Content-Range": f"bytes {start}-{end}/{downloader.size_bytes}",
-                        "Authorization": f"Bearer {self.creds.token}",
-                    }
-                    file_id = await self.upload_chunk(drive_location, put_headers, chunk)
-                    start += len(chunk)
-                    store["uploaded_size"] += len(chunk)
-                    buffer = buffer[chunk_size:]
-
-            if buffer:
-                end = start + len(buffer) - 1
-                put_headers = {
-                    "Content-Range": f"bytes {start}-{end}/{downloader.size_bytes}",
-                    "Authorization": f"Bearer {self.creds.token}",
-                }
-                file_id = await self.upload_chunk(drive_location, put_headers, buffer)
-                start = end + 1
-                store["uploaded_size"] = start
-                buffer = b""
+            session = await self.new_session(
+                file_name=downloader.file_name,
+                size=downloader.size_bytes,
+                folder_id=folder_id,
+                source={"type": "url", "url": file_url, "is_encoded": is_encoded},
+            )
+            file = await self._run_session(
+                session, transfer, downloader.iter_chunks(self.UPLOAD_CHUNK_SIZE), digest=digest
+            )
 
-        store["done"] = True
-        return file_id
+        return file
 
     async def _upload_from_telegram(
         self,
         media_message: Message,
         message_to_edit: Message = None,
         folder_id: str = None,
-    ):
+        transfer: Transfer = None,
+        digest: UploadDigest = None,
+    ) -> dict:
         media = get_tg_media_details(media_message)
+        transfer.total = getattr(media, "file_size", 0)
+        transfer.file_name = media.file_name
+
+        session = await self.new_session(
+            file_name=media.file_name,
+            size=transfer.total,
+            folder_id=folder_id,
+            source={"type": "telegram", "chat_id": media_message.chat.id, "message_id": media_message.id},
+        )
+        chunk_iter = iter_media_parallel(
+            message_to_edit._client, media_message, transfer.total, workers=self.TG_WORKERS
+        )
+        return await self._run_session(session, transfer, chunk_iter, digest=digest)
 
-        store = self._progress_store[message_to_edit.task_id]
-        store["size"] = getattr(media, "file_size", 0)
-        store["done"] = False
-        store["uploaded_size"] = 0
-        store["edit_task"] = asyncio.create_task(self.progress_worker(store, message_to_edit), name="tg_drive_up_prog")
+    async def _run_session(
+        self, session: dict, transfer: Transfer, chunk_iter=None, digest: UploadDigest = None
+    ) -> dict:
+        """
+        Pipe the session's source into Drive, re-opening the source
+        from the committed offset when it fails mid-way.
+        """
+        self.active_sessions.add(session["_id"])
+        try:
+            for attempt in range(self.MAX_RETRIES + 1):
+                if chunk_iter is None:
+                    chunk_iter = await self._open_source(session)
+                try:
+                    file = await self._pipe_chunks(session, transfer, chunk_iter, digest)
+                    break
+                except (aiohttp.ClientError, ConnectionError, TimeoutError) as e:
+                    if attempt == self.MAX_RETRIES:
+                        raise
+                    bot.log.info(f"Drive upload source error: {e}, retrying {session['file_name']}...")
+                    await asyncio.sleep(min(2**attempt, 60))
+                    committed = await self.query_upload_status(session["location"], session["size"])
+                    if isinstance(committed, dict):
+                        file = committed
+                        break
+                    if digest and digest.size != committed:
+                        # Drive kept part of a chunk that never reached the digest
+                        digest.valid = False
+                    session["offset"] = committed
+                    await DB.add_data(session)
+                    chunk_iter = None
+
+            await DB.delete_data({"_id": session["_id"]})
+        finally:
+            self.active_sessions.discard(session["_id"])
+        return file
 
-        start = 0
-        drive_location = await self.create_file(media.file_name, folder_id)
-        file_id = None
+    async def _open_source(self, session: dict):
+        source = session["source"]
+        offset = session["offset"]
+
+        if source["type"] == "url":
+            return self._iter_url(source["url"], source.get("is_encoded", False), offset)
+
+        if source["type"] == "file":
+            return self._iter_file(source["path"], offset)
+
+        message = await bot.get_messages(chat_id=source["chat_id"], message_ids=source["message_id"])
+        chunk_offset, skip = divmod(offset, MEDIA_CHUNK_SIZE)
         # noinspection PyTypeChecker
-        async for chunk in message_to_edit._client.stream_media(message=media_message):
-            end = start + len(chunk) - 1
-            headers = {
-                "Content-Range": f"bytes {start}-{end}/{getattr(media, 'file_size', 0)}",
-                "Authorization": f"Bearer {self.creds.token}",
-            }
-            file_id = await self.upload_chunk(drive_location, headers, chunk)
-            start = end + 1
-            store["uploaded_size"] = end + 1
+        return skip_bytes(
+            iter_media_parallel(
+                message._client, message, session["size"], offset=chunk_offset, workers=self.TG_WORKERS
+            ),
+            skip,
+        )
 
-        return file_id
+    async def _iter_url(self, url: str, is_encoded: bool, offset: int):
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        async with self._aiohttp_session.get(
+            URL(url, encoded=is_encoded), headers=headers, timeout=STREAM_TIMEOUT
+        ) as resp:
+            resp.raise_for_status()
+            # Server ignored the Range header: drop what Drive already has
+            skip = offset if resp.status != 206 else 0
+            async for chunk in skip_bytes(resp.content.iter_chunked(self.UPLOAD_CHUNK_SIZE), skip):
+                yield chunk
+
+    async def _iter_file(self, path: str, offset: int):
+        # Also covers sessions continued by .gresume, outside of upload_folder's hold
+        async with STORAGE.hold(path):
+            with open(path, "rb") as file:
+                file.seek(offset)
+                while chunk := await asyncio.to_thread(file.read, self.FILE_READ_SIZE):
+                    yield chunk
+
+    async def _pipe_chunks(
+        self, session: dict, transfer: Transfer, chunk_iter, digest: UploadDigest = None
+    ) -> dict | None:
+        # Bounded queue: source keeps streaming while the previous chunk is being PUT
+        queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        producer = asyncio.create_task(self._produce_chunks(chunk_iter, queue), name="drive_up_fetch")
+        try:
+            file = await self._consume_chunks(queue, session, transfer, digest)
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+            # Wait for the source stream to close before a retry re-opens it
+            await asyncio.gather(producer, return_exceptions=True)
+        return file
 
     @staticmethod
-    async def progress_worker(store: dict, message: Message):
-        if not isinstance(message, Message):
+    async def _produce_chunks(chunk_iter, queue: asyncio.Queue):
+        """
+        Feed chunk_iter into queue, then None once it is exhausted.
+        A failing source puts its exception instead, so the upload is never finalised truncated.
+        """
+        try:
+            async for chunk in chunk_iter:
+                await queue.put(chunk)
+        except Exception as e:
+            await queue.put(e)
             return
+        finally:
+            if hasattr(chunk_iter, "aclose"):
+                await chunk_iter.aclose()
+        await queue.put(None)
+
+    async def _consume_chunks(
+        self, queue: asyncio.Queue, session: dict, transfer: Transfer, digest: UploadDigest = None
+    ) -> dict | None:
+        start = session["offset"]
+        total_size = session["size"]
+        file = None
+        last_saved = time.monotonic()
+        assembler = ChunkAssembler(max_size=self.MAX_CHUNK_SIZE)
+        # PUT of the last full chunk, the next one is assembled from the queue meanwhile
+        put: asyncio.Task | None = None
 
-        while not store["done"]:
-            await progress(
-                current_size=store["uploaded_size"],
-                total_size=store["size"] or 1,
-                response=message,
-                action_str="Uploading to Drive...",
+        try:
+            while (data := await queue.get()) is not None:
+                if isinstance(data, Exception):
+                    raise data
+                data = memoryview(data)
+                while data:
+                    data = data[assembler.feed(data) :]
+                    if not assembler.is_full:
+                        continue
+
+                    if put:
+                        file = await put
+                    size = assembler.filled
+                    put = asyncio.create_task(
+                        self._put_assembled(
+                            assembler, assembler.take(), session, start, total_size, transfer, digest
+                        ),
+                        name="drive_up_put",
+                    )
+                    start += size
+
+                    if time.monotonic() - last_saved > self.SESSION_SAVE_INTERVAL:
+                        await DB.add_data(session)
+                        last_saved = time.monotonic()
+
+            if put:
+                file = await put
+        finally:
+            if put and not put.done():
+                put.cancel()
+                await asyncio.gather(put, return_exceptions=True)
+
+        if assembler.filled:
+            size = assembler.filled
+            file = await self._put_assembled(
+                assembler, assembler.take(), session, start, total_size or start + size, transfer, digest
             )
-            await asyncio.sleep(5)
+        elif file is None and not total_size:
+            # Size was unknown and the stream ended on a chunk boundary: finalise with an empty PUT
+            put_headers = {"Content-Range": f"bytes */{start}", "Authorization": await self.bearer()}
+            file = await self.upload_chunk(session["location"], put_headers, b"")
+
+        return file
+
+    async def _put_assembled(
+        self,
+        assembler: ChunkAssembler,
+        chunk: memoryview,
+        session: dict,
+        start: int,
+        total_size: int,
+        transfer: Transfer,
+        digest: UploadDigest = None,
+    ) -> dict | None:
+        size = len(chunk)
+        offset = start
+        file = None
+        put_start = time.perf_counter()
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            put_headers = {
+                "Content-Range": f"bytes {offset}-{start + size - 1}/{total_size or '*'}",
+                "Authorization": await self.bearer(),
+            }
+            try:
+                file = await self.upload_chunk(session["location"], put_headers, chunk[offset - start :])
+                break
+            except (DriveUploadError, aiohttp.ClientError, TimeoutError) as e:
+                if attempt == self.MAX_RETRIES or (isinstance(e, DriveUploadError) and not e.is_retryable):
+                    raise
+                await asyncio.sleep(min(2**attempt, 60))
+                committed = await self.query_upload_status(session["location"], total_size)
+                if isinstance(committed, dict):
+                    file = committed
+                    break
+                if committed >= start + size:
+                    break
+                offset = max(committed, start)
+
+        if digest:
+            digest.update(chunk)
+        assembler.adapt(put_size=size, put_time=time.perf_counter() - put_start)
+        session["offset"] = start + size
+        transfer.update(size)
+        return file
+
+    @staticmethod
+    def parse_id(file_ref: str) -> str:
+        if match := DRIVE_ID_REGEX.search(file_ref):
+            return match.group(1)
+        return file_ref.strip()
+
+    async def resolve_file(self, file_ref: str) -> dict:
+        """
+        :param file_ref: Drive file id or url, shortcuts are followed to their target.
+        :return: Metadata of a downloadable file.
+        """
+        fields = "id, name, mimeType, size, md5Checksum, shortcutDetails"
+        meta = await self.get_file(self.parse_id(file_ref), fields=fields)
+
+        if meta["mimeType"] == self.SHORTCUT_MIME:
+            meta = await self.get_file(meta["shortcutDetails"]["targetId"], fields=fields)
+
+        if meta["mimeType"] == self.FOLDER_MIME:
+            raise ValueError("Folders can't be downloaded.")
+
+        if "size" not in meta:
+            raise ValueError("Google Workspace documents have no binary content to download.")
+
+        return meta
+
+    def media_download(self, meta: dict, connections: int, transfer: Transfer | None = None) -> SegmentedDownload:
+        """
+        :param transfer: Counts downloaded bytes, leave out when another leg reports progress.
+        """
+
+        async def headers() -> dict:
+            return {"Authorization": await self.bearer()}
+
+        return SegmentedDownload(
+            session=self._aiohttp_session,
+            url=f"{API_URL}/files/{meta['id']}?alt=media",
+            size=int(meta["size"]),
+            connections=connections,
+            headers=headers,
+            on_progress=transfer.update if transfer else None,
+        )
+
+    async def download(
+        self, file_ref: str, dir_name: Path, message_to_edit: Message = None, connections: int = 4
+    ) -> str:
+        try:
+            meta = await self.resolve_file(file_ref)
+            size = int(meta["size"])
+            async with STORAGE.reserve(dir_name, size):
+                with PROGRESS.track(message_to_edit, size, "Downloading from Drive...", meta["name"]) as transfer:
+                    downloader = self.media_download(meta, connections, transfer)
+                    path = await downloader.to_file(dir_name / meta["name"])
+            return f"<code>{path}</code>\n\n<code>{bytes_to_mb(downloader.size)}</code> mb\n\n<b>Downloaded.</b>"
+        except Exception as e:
+            return f"Error:\n{e}"
+
+    async def download_to_telegram(
+        self, file_ref: str, message: Message, message_to_edit: Message = None, connections: int = 4
+    ) -> str | None:
+        try:
+            meta = await self.resolve_file(file_ref)
+            downloader = self.media_download(meta, connections)
+            with PROGRESS.track(message_to_edit, downloader.size, "Streaming to TG...", meta["name"]) as transfer:
+                await send_stream(
+                    client=message._client,
+                    chat_id=message.chat.id,
+                    chunk_iter=downloader.iter_chunks(),
+                    file_name=meta["name"],
+                    file_size=downloader.size,
+                    caption=meta["name"],
+                    reply_to_message_id=message.reply_id,
+                    on_part=transfer.update,
+                )
+        except Exception as e:
+            return f"Error:\n{e}"
 
 
 drive = Drive()
@@ -331,6 +1324,16 @@ async def init_task():
     await drive.async_init()
 
 
+@BOT.register_worker(interval=int(os.getenv("DRIVE_INDEX_SYNC_INTERVAL", 120)), name="drive-index-sync")
+async def drive_index_worker():
+    if not drive.is_authenticated:
+        return
+    try:
+        await drive.index.sync()
+    except Exception as e:
+        bot.log.error(f"Drive index sync failed: {e}")
+
+
 @BOT.add_cmd("gsetup")
 async def gdrive_creds_setup(bot: BOT, message: Message):
     """
@@ -396,14 +1399,20 @@ async def set_drive_creds(bot: BOT, message: Message):
         creds_json = json.loads(creds)
         creds = Credentials.from_authorized_user_info(info=creds_json)
 
-        if creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+        # Catch malformed or revoked creds now, not in the background refresh later
+        drive.creds = creds
+        if creds.refresh_token:
+            await drive.refresh_token()
+        else:
+            await drive.get_file("root", fields="id")
 
         await DB.add_data({"_id": "drive_creds", "creds": json.loads(creds.to_json())})
         await drive.set_creds()
         await message.reply("Creds added!")
     except Exception as e:
-        await message.reply(e)
+        # Back to the stored creds, if there are any
+        await drive.set_creds()
+        await message.reply(f"Creds not added:\n{e}")
 
 
 @BOT.add_cmd("rgcreds")
@@ -417,6 +1426,7 @@ async def remove_drive_creds(bot: BOT, message: Message):
 
     drive.is_authenticated = False
     await DB.delete_data({"_id": "drive_creds"})
+    await drive.index.reset()
     await response.edit("Creds Deleted Successfully!")
 
 
@@ -431,6 +1441,7 @@ async def list_drive(bot: BOT, message: Message):
         -d: list dirs only
         -id: list via folder id
         -l: limit of results (10 by default)
+        -r: query drive directly instead of the local index
 
     USAGE:
         .gls [-f|-d]
@@ -449,6 +1460,7 @@ async def list_drive(bot: BOT, message: Message):
         "folder_only": False,
         "file_only": False,
         "search_param": None,
+        "remote": "-r" in flags,
     }
 
     # Search by ID
@@ -500,6 +1512,18 @@ async def list_drive(bot: BOT, message: Message):
     await response.edit(list_str, parse_mode=ParseMode.HTML)
 
 
+@BOT.add_cmd(cmd="gindex")
+@drive.ensure_creds
+async def rebuild_drive_index(bot: BOT, message: Message):
+    """
+    CMD: GINDEX
+    INFO: Rebuild the local Drive metadata index used by .gls
+    """
+    response = await message.reply("Rebuilding Drive index...")
+    await drive.index.rebuild()
+    await response.edit(f"Drive index rebuilt: <b>{len(drive.index.entries)}</b> entries.")
+
+
 @BOT.add_cmd(cmd="gup")
 @drive.ensure_creds
 async def upload_to_drive(bot: BOT, message: Message):
@@ -509,14 +1533,24 @@ async def upload_to_drive(bot: BOT, message: Message):
     FLAGS:
         -id: folder id
         -e: if the url is encoded
+        -dir: upload a local folder, skipping files already in drive
     USAGE:
         .gup [reply to a message | url]
         .gup -id <folder id> [reply to a message | url]
+        .gup -dir [-id <folder id>] downloads/videos
     """
     reply = message.replied
     response = await message.reply("Checking Input...")
 
-    if reply and reply.media:
+    if "-dir" in message.flags:
+        if "-id" in message.flags:
+            folder_id, path = message.filtered_input.split(maxsplit=1)
+        else:
+            folder_id, path = None, message.filtered_input
+
+        upload_coro = drive.upload_folder(Path(path), folder_id=folder_id, message_to_edit=response)
+
+    elif reply and reply.media:
         folder_id = message.filtered_input if "-id" in message.flags else None
         upload_coro = drive.upload_from_telegram(reply, response, folder_id=folder_id)
 
@@ -538,4 +1572,111 @@ async def upload_to_drive(bot: BOT, message: Message):
         await response.edit("Invalid Input!!!")
         return
 
-    await response.edit(await upload_coro)
+    await response.edit(await JOBS.run("drive", message, response, upload_coro))
+
+
+@BOT.add_cmd(cmd="gresume")
+@drive.ensure_creds
+async def resume_drive_uploads(bot: BOT, message: Message):
+    """
+    CMD: GRESUME
+    INFO: Resume Drive uploads interrupted by errors or restarts.
+    FLAGS:
+        -l: list unfinished uploads
+        -c: clear unfinished uploads
+    USAGE:
+        .gresume [-l|-c]
+    """
+    sessions = [
+        session
+        async for session in DB.find({"type": "drive_upload_session"})
+        if session["_id"] not in drive.active_sessions
+    ]
+
+    if not sessions:
+        await message.reply("No unfinished uploads.")
+        return
+
+    if "-l" in message.flags:
+        list_str = "\n".join(
+            f"• <code>{session['file_name']}</code> [{session['offset']}/{session['size'] or '?'}]"
+            for session in sessions
+        )
+        await message.reply(f"Unfinished uploads:\n\n{list_str}")
+        return
+
+    if "-c" in message.flags:
+        await asyncio.gather(*[DB.delete_data({"_id": session["_id"]}) for session in sessions])
+        await message.reply(f"Cleared {len(sessions)} unfinished uploads.")
+        return
+
+    async def resume(session: dict):
+        response = await message.reply(f"Resuming <code>{session['file_name']}</code>...")
+        await response.edit(await drive.resume_session(session, response))
+
+    await asyncio.gather(*[resume(session) for session in sessions])
+
+
+@BOT.add_cmd(cmd="gclone")
+@drive.ensure_creds
+async def clone_drive_files(bot: BOT, message: Message):
+    """
+    CMD: GCLONE
+    INFO: Copy a shared Drive file/folder into your Drive without downloading it.
+    FLAGS:
+        -id: destination folder id
+    USAGE:
+        .gclone <drive url | id>
+        .gclone -id <folder id> <drive url | id>
+    """
+    if "-id" in message.flags:
+        folder_id, file_ref = message.filtered_input.split(maxsplit=1)
+    else:
+        folder_id, file_ref = None, message.filtered_input
+
+    if not file_ref:
+        await message.reply("Give a Drive file/folder id | url.")
+        return
+
+    response = await message.reply("Cloning...")
+    await response.edit(await JOBS.run("drive", message, response, drive.clone(file_ref, folder_id)))
+
+
+@BOT.add_cmd(cmd="gdl")
+@drive.ensure_creds
+async def download_from_drive(bot: BOT, message: Message):
+    """
+    CMD: GDL
+    INFO: Download a Drive file using parallel connections.
+    FLAGS:
+        -c: number of connections (4 by default)
+        -tg: stream to telegram without saving to disk
+    USAGE:
+        .gdl <id | url>
+        .gdl -c 8 <id | url>
+        .gdl -tg <id | url>
+    """
+    if "-c" in message.flags:
+        connections, file_ref = message.filtered_input.split(maxsplit=1)
+        connections = int(connections)
+    else:
+        connections, file_ref = 4, message.filtered_input
+
+    if not file_ref:
+        await message.reply("Give a Drive file id | url.")
+        return
+
+    response = await message.reply("Fetching file info...")
+
+    if "-tg" in message.flags:
+        error = await JOBS.run(
+            "drive", message, response, drive.download_to_telegram(file_ref, message, response, connections)
+        )
+        if error:
+            await response.edit(error)
+        else:
+            await response.delete()
+        return
+
+    download_coro = drive.download(file_ref, Path("downloads") / str(time.time()), response, connections)
+    await response.edit(await JOBS.run("drive", message, response, download_coro))
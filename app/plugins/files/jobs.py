@@ -0,0 +1,268 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import defaultdict
+from collections.abc import Coroutine
+from uuid import uuid4
+
+from ub_core.utils import bytes_to_mb
+
+from app import BOT, Config, CustomDB, Message, bot
+from app.plugins.files.transfer_progress import PROGRESS
+
+DB = CustomDB["TRANSFER_JOBS"]
+
+# Jobs running at once, across all kinds
+MAX_JOBS = int(os.getenv("TRANSFER_MAX_JOBS", 4))
+KIND_LIMITS = {
+    "download": int(os.getenv("TRANSFER_MAX_DOWNLOADS", 3)),
+    "upload": int(os.getenv("TRANSFER_MAX_UPLOADS", 2)),
+    "rename": int(os.getenv("TRANSFER_MAX_RENAMES", 2)),
+    "drive": int(os.getenv("TRANSFER_MAX_DRIVE", 2)),
+}
+# Lower runs first
+DEFAULT_PRIORITY = 5
+# Interrupted Drive uploads continue from their saved session through .gresume
+RESUMABLE_CMDS = {"gup"}
+
+
+class Job:
+    def __init__(self, job_id: str, kind: str, message: Message, response: Message, description: str, priority: int):
+        self.id = job_id
+        self.kind = kind
+        self.message = message
+        self.response = response
+        self.description = description
+        self.priority = priority
+        self.state = "queued"
+        self.created = time.time()
+        self.task: asyncio.Task | None = None
+        self.started: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def to_dict(self) -> dict:
+        return {
+            "_id": self.id,
+            "kind": self.kind,
+            "cmd": getattr(self.message, "cmd", None),
+            "chat_id": self.message.chat.id,
+            "message_id": self.message.id,
+            "description": self.description,
+            "priority": self.priority,
+            "state": self.state,
+            "created": self.created,
+        }
+
+    @property
+    def transfer(self):
+        if not isinstance(self.response, Message):
+            return None
+        return PROGRESS.transfers.get(self.response.chat.id, {}).get(self.response.id)
+
+
+class JobManager:
+    """
+    Priority queue for transfers with a global and a per-kind cap on running jobs.
+
+    Jobs run inside the command's own task and only wait here for a slot,
+    so cancelling a job is cancelling that task. Unfinished jobs are kept
+    in the DB: queued ones are re-run after a restart, interrupted ones are
+    reported since re-running them could repeat what they already did.
+    """
+
+    counter = itertools.count()
+
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+        self.running: dict[str, int] = defaultdict(int)
+        self._queue: list[tuple[int, int, Job]] = []
+        self.restore_pending: list[dict] = []
+
+    async def run(
+        self,
+        kind: str,
+        message: Message,
+        response: Message,
+        coro: Coroutine,
+        description: str = "",
+        priority: int = DEFAULT_PRIORITY,
+    ):
+        """Wait for a free slot, then await coro as a tracked job."""
+        job = Job(self.new_id(), kind, message, response, description or getattr(message, "input", ""), priority)
+        job.task = asyncio.current_task()
+        self.jobs[job.id] = job
+        heapq.heappush(self._queue, (job.priority, next(self.counter), job))
+        await DB.add_data(job.to_dict())
+
+        try:
+            self._dispatch()
+            if not job.started.done():
+                if isinstance(response, Message):
+                    await response.edit(f"Queued as job <code>{job.id}</code> [{kind}, priority {priority}]")
+                try:
+                    await job.started
+                except asyncio.CancelledError:
+                    if isinstance(response, Message):
+                        await response.edit(f"Job <code>{job.id}</code> cancelled while queued.")
+                    raise
+
+            job.state = "running"
+            await DB.add_data(job.to_dict())
+            return await coro
+
+        finally:
+            coro.close()
+            # A job cancelled while queued never got a slot
+            if job.started.done() and not job.started.cancelled():
+                self.running[kind] -= 1
+            job.state = "done"
+            self.jobs.pop(job.id, None)
+            await DB.delete_data({"_id": job.id})
+            self._dispatch()
+
+    def new_id(self) -> str:
+        # Ids of jobs persisted before a restart stay taken until they are restored
+        taken = self.jobs.keys() | {job["_id"] for job in self.restore_pending}
+        while (job_id := uuid4().hex[:6]) in taken:
+            continue
+        return job_id
+
+    def _dispatch(self):
+        """Start queued jobs in priority order while their kind has room."""
+        waiting = []
+        while self._queue and sum(self.running.values()) < MAX_JOBS:
+            entry = heapq.heappop(self._queue)
+            job = entry[2]
+            if job.started.done():
+                continue
+            if self.running[job.kind] >= KIND_LIMITS.get(job.kind, MAX_JOBS):
+                waiting.append(entry)
+                continue
+            self.running[job.kind] += 1
+            job.state = "starting"
+            job.started.set_result(None)
+        for entry in waiting:
+            heapq.heappush(self._queue, entry)
+
+    async def set_priority(self, job: Job, priority: int):
+        job.priority = priority
+        self._queue = [(job.priority, seq, j) if j is job else (p, seq, j) for p, seq, j in self._queue]
+        heapq.heapify(self._queue)
+        await DB.add_data(job.to_dict())
+        self._dispatch()
+
+    def cancel(self, job: Job):
+        if job.task and not job.task.done():
+            job.task.cancel()
+
+    @property
+    def bandwidth(self) -> float:
+        """Bytes per second summed over running jobs."""
+        speed = 0.0
+        for job in self.jobs.values():
+            if job.state == "running" and (transfer := job.transfer):
+                elapsed = time.monotonic() - transfer.started
+                speed += transfer.current / elapsed if elapsed else 0
+        return speed
+
+    async def restore(self):
+        """Re-run the commands of jobs left queued by the last shutdown and report interrupted ones."""
+        pending, self.restore_pending = self.restore_pending, []
+
+        for job in pending:
+            await DB.delete_data({"_id": job["_id"]})
+            try:
+                message = Message(await bot.get_messages(chat_id=job["chat_id"], message_ids=job["message_id"]))
+            except Exception as e:
+                bot.log.error(f"Transfer job {job['_id']} lost in restart, couldn't fetch its message: {e}")
+                continue
+
+            cmd = job.get("cmd")
+            if job["state"] != "queued":
+                hint = "continue it with .gresume" if cmd in RESUMABLE_CMDS else f"check its output and re-run .{cmd}"
+                await message.reply(f"Job <code>{job['_id']}</code> was interrupted by a restart, {hint}")
+                continue
+
+            if not (cmd_object := Config.CMD_DICT.get(cmd)):
+                await message.reply(f"Job <code>{job['_id']}</code> was lost in a restart: .{cmd} no longer exists.")
+                continue
+
+            asyncio.create_task(cmd_object.func(bot, message), name=f"job_{job['_id']}")
+
+
+JOBS = JobManager()
+
+
+async def init_task():
+    JOBS.restore_pending = [job async for job in DB.find()]
+
+
+@BOT.register_worker(interval=30, name="transfer-jobs-restore")
+async def restore_jobs_worker():
+    if JOBS.restore_pending:
+        await JOBS.restore()
+
+
+@BOT.add_cmd(cmd="jobs")
+async def list_jobs(bot: BOT, message: Message):
+    """
+    CMD: JOBS
+    INFO: List running and queued transfer jobs.
+    USAGE:
+        .jobs
+    """
+    if not JOBS.jobs:
+        await message.reply("No transfer jobs.")
+        return
+
+    lines = []
+    for job in sorted(JOBS.jobs.values(), key=lambda j: (j.state != "running", j.priority, j.created)):
+        line = f"• <code>{job.id}</code> [{job.kind}|p{job.priority}|{job.state}] {job.description[:40]}"
+        if job.state == "running" and (transfer := job.transfer):
+            line += f"\n    <code>{bytes_to_mb(transfer.current)}/{bytes_to_mb(transfer.total)}</code> mb"
+        lines.append(line)
+
+    limits = ", ".join(f"{kind}: {JOBS.running[kind]}/{limit}" for kind, limit in KIND_LIMITS.items())
+    await message.reply(
+        "\n".join(lines)
+        + f"\n\n<b>Running</b>: <code>{sum(JOBS.running.values())}/{MAX_JOBS}</code> ({limits})"
+        + f"\n<b>Bandwidth</b>: <code>{bytes_to_mb(JOBS.bandwidth)}</code> mb/s"
+    )
+
+
+@BOT.add_cmd(cmd="jobcancel")
+async def cancel_job(bot: BOT, message: Message):
+    """
+    CMD: JOBCANCEL
+    INFO: Cancel a running or queued transfer job.
+    USAGE:
+        .jobcancel <job id>
+    """
+    job = JOBS.jobs.get(message.filtered_input)
+    if not job:
+        await message.reply("Invalid job id, check .jobs")
+        return
+
+    JOBS.cancel(job)
+    await message.reply(f"Cancelled job <code>{job.id}</code>.")
+
+
+@BOT.add_cmd(cmd="jobprio")
+async def job_priority(bot: BOT, message: Message):
+    """
+    CMD: JOBPRIO
+    INFO: Change the priority of a queued transfer job, lower runs first.
+    USAGE:
+        .jobprio <job id> <0-9>
+    """
+    try:
+        job_id, priority = message.filtered_input.split()
+        job = JOBS.jobs[job_id]
+        priority = int(priority)
+    except (ValueError, KeyError):
+        await message.reply("Invalid input, usage: .jobprio <job id> <0-9>")
+        return
+
+    await JOBS.set_priority(job, priority)
+    await message.reply(f"Job <code>{job.id}</code> priority set to {priority}.")
@@ -1,4 +1,11 @@
+from pyrogram import raw
 from ub_core import BOT, Message
+from yarl import URL
+
+from app.plugins.files.segmented_download import SegmentedDownload, get_session
+from app.plugins.files.tg_stream import PART_SIZE, send_stream
+from app.plugins.files.transfer_progress import PROGRESS
+from app.plugins.files.upload import size_over_limit
 
 LEECH_TYPE_MAP: dict[str, str] = {
     "-p": "photo",
@@ -23,10 +30,18 @@ async def leech_urls_to_tg(bot: BOT, message: Message):
 
         -s: to leech with spoiler
 
+        -st: stream the link through the bot without touching the disk,
+            for files too big for Telegram to fetch itself.
+            -c N: fetch over N parallel connections
+
     USAGE:
         .l { flag } link | file_id
         .l { flag } -s link | file_id
+        .l -st [-v] [-c 4] link
     """
+    if "-st" in message.flags:
+        await stream_leech(bot, message)
+        return
 
     try:
         method_str = LEECH_TYPE_MAP.get(message.flags[0])
@@ -52,3 +67,72 @@ async def leech_urls_to_tg(bot: BOT, message: Message):
     except Exception as exc:
         await message.reply(exc)
         return
+
+
+async def stream_leech(bot: BOT, message: Message):
+    """
+    Pipe the HTTP response straight into SaveBigFilePart uploads.
+    Memory holds a few parts at a time, nothing is written to disk.
+    """
+    url = message.filtered_input
+    connections = 0
+
+    if "-c" in message.flags:
+        connections, url = url.split(maxsplit=1)
+        connections = int(connections)
+
+    if not url.startswith("http"):
+        await message.reply("Invalid Input.\nCheck Help!")
+        return
+
+    response = await message.reply("Checking link...")
+    session = get_session()
+    resp = None
+
+    try:
+        downloader = None
+        if connections:
+            downloader = await SegmentedDownload.from_url(session, url, connections=connections)
+
+        if downloader:
+            file_name, file_size = downloader.file_name, downloader.size
+            chunk_iter = downloader.iter_chunks()
+        else:
+            resp = await session.get(url)
+            resp.raise_for_status()
+            disposition = resp.content_disposition
+            file_name = (disposition and disposition.filename) or URL(url).name
+            file_size = resp.content_length or 0
+            chunk_iter = resp.content.iter_chunked(PART_SIZE)
+
+        file_name = file_name or "leech"
+
+        if size_over_limit(file_size / 1048576, client=bot):
+            await response.edit("<b>Aborted</b>, File size exceeds TG Limits!!!")
+            return
+
+        attributes = None
+        if "-v" in message.flags:
+            attributes = [raw.types.DocumentAttributeVideo(duration=0, w=0, h=0, supports_streaming=True)]
+
+        with PROGRESS.track(response, file_size, "Leeching...", file_name) as transfer:
+            await send_stream(
+                client=bot,
+                chat_id=message.chat.id,
+                chunk_iter=chunk_iter,
+                file_name=file_name,
+                file_size=file_size,
+                caption=file_name,
+                reply_to_message_id=message.reply_id,
+                on_part=transfer.update,
+                attributes=attributes,
+                force_document=attributes is None,
+            )
+        await response.delete()
+
+    except Exception as exc:
+        await response.edit(str(exc))
+
+    finally:
+        if resp is not None:
+            resp.release()
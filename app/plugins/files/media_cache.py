@@ -0,0 +1,168 @@
+import asyncio
+import os
+import shutil
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from ub_core.utils import get_tg_media_details
+
+from app import Message
+from app.plugins.files.tg_stream import download_parallel
+
+CACHE_DIR = Path("downloads") / ".media_cache"
+# Disk budget in MiB, 0 disables the cache
+MEDIA_CACHE_SIZE = int(os.getenv("MEDIA_CACHE_SIZE", 2048)) * 1048576
+
+
+def hard_link(src: Path, dest: Path):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    dest.unlink(missing_ok=True)
+    os.link(src, dest)
+
+
+def link_or_copy(src: Path, dest: Path):
+    """Hard link src to dest, falling back to a copy across filesystems."""
+    try:
+        hard_link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class MediaCache:
+    """
+    Local copies of Telegram media keyed by file_unique_id.
+
+    Entries are hard links, so caching a download costs no extra space until
+    the original is deleted. The index is kept in LRU order and the least
+    recently used entries are dropped once the cache grows past max_size.
+    """
+
+    def __init__(self, root: Path = CACHE_DIR, max_size: int = MEDIA_CACHE_SIZE):
+        self.root = root
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self._pending: dict[str, asyncio.Future] = {}
+        self._loaded = False
+
+    def _load(self):
+        """Rebuild the index from disk, least recently used first."""
+        self._loaded = True
+        if not self.root.is_dir():
+            return
+        stats = sorted(((file.stat(), file.name) for file in self.root.iterdir()), key=lambda s: s[0].st_mtime)
+        for stat, unique_id in stats:
+            self.entries[unique_id] = stat.st_size
+            self.size += stat.st_size
+        self.evict()
+
+    def path(self, unique_id: str) -> Path:
+        return self.root / unique_id
+
+    def get(self, unique_id: str) -> Path | None:
+        if not self._loaded:
+            self._load()
+
+        if unique_id not in self.entries:
+            return None
+
+        path = self.path(unique_id)
+        if not path.is_file():
+            self.size -= self.entries.pop(unique_id)
+            return None
+
+        self.entries.move_to_end(unique_id)
+        # mtime doubles as last access so LRU order survives restarts
+        os.utime(path)
+        return path
+
+    async def add(self, unique_id: str, file: Path | str):
+        """
+        Cache file under unique_id, only as a hard link: files outside
+        downloads/ or on another filesystem would cost a full copy.
+        Only the link is made in a thread, the index is only touched on the loop.
+        """
+        file = Path(file)
+        if not file.resolve().is_relative_to(self.root.parent.resolve()):
+            return
+
+        size = file.stat().st_size
+        if size > self.max_size:
+            return
+
+        if not self._loaded:
+            self._load()
+
+        try:
+            await asyncio.to_thread(hard_link, file, self.path(unique_id))
+        except OSError:
+            return
+
+        if unique_id in self.entries:
+            self.size -= self.entries.pop(unique_id)
+        self.entries[unique_id] = size
+        self.size += size
+        self.evict()
+
+    def evict(self):
+        while self.size > self.max_size and self.entries:
+            unique_id, size = self.entries.popitem(last=False)
+            self.path(unique_id).unlink(missing_ok=True)
+            self.size -= size
+
+    @asynccontextmanager
+    async def single_flight(self, key: str):
+        """Wait for a running fill of key, then hold key until the block exits."""
+        while (pending := self._pending.get(key)) is not None:
+            await asyncio.wait([pending])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            yield
+        finally:
+            self._pending.pop(key, None)
+            future.set_result(None)
+
+    async def fetch(self, unique_id: str, dest: Path, download: Callable[[Path], Awaitable]) -> Path:
+        """
+        Place the media at dest, from the cache if present, else through download(dest).
+        Concurrent fetches of the same media wait for a single download.
+        """
+        async with self.single_flight(unique_id):
+            if (cached := self.get(unique_id)) is not None:
+                await asyncio.to_thread(link_or_copy, cached, dest)
+                return dest
+
+            await download(dest)
+            if self.max_size:
+                await self.add(unique_id, dest)
+
+        return dest
+
+
+MEDIA_CACHE = MediaCache()
+
+
+async def download_media(
+    message: Message,
+    path: Path | str,
+    workers: int = 4,
+    on_chunk: Callable[[int], None] | None = None,
+) -> Path:
+    """Cache aware download_parallel."""
+    media = get_tg_media_details(message)
+
+    async def download(dest: Path):
+        await download_parallel(
+            client=message._client,
+            message=message,
+            path=dest,
+            file_size=media.file_size,
+            workers=workers,
+            on_chunk=on_chunk,
+        )
+
+    return await MEDIA_CACHE.fetch(media.file_unique_id, Path(path), download)
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+from functools import partial
+from pathlib import Path
+
+from app.plugins.files.thumb_cache import THUMB_CACHE, content_key
+
+# Probe results kept in memory
+CACHE_SIZE = 1024
+
+_CACHE: dict[tuple[str, int, int], "MediaInfo"] = {}
+
+
+class MediaInfo:
+    """Parsed ffprobe output of a media file."""
+
+    def __init__(self, data: dict):
+        self.streams: list[dict] = data.get("streams", [])
+        self.duration = int(float(data.get("format", {}).get("duration") or 0))
+
+        # Cover art is reported as a video stream too
+        video = next(
+            (
+                stream
+                for stream in self.streams
+                if stream.get("codec_type") == "video" and not stream.get("disposition", {}).get("attached_pic")
+            ),
+            None,
+        )
+        self.has_video = video is not None
+        self.has_audio = any(stream.get("codec_type") == "audio" for stream in self.streams)
+        self.width = int(video.get("width", 0)) if video else 0
+        self.height = int(video.get("height", 0)) if video else 0
+        self.thumb: str | None = None
+
+    @property
+    def thumb_timestamp(self) -> float:
+        # A bit in, to skip black intro frames
+        return round(self.duration * 0.1, 2)
+
+
+async def _run(*args: str) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    stdout, _ = await proc.communicate()
+    return stdout
+
+
+async def extract_thumb(path: str, timestamp: float, output: Path) -> str | None:
+    output.parent.mkdir(parents=True, exist_ok=True)
+    await _run(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-ss", str(timestamp), "-i", path,
+        "-frames:v", "1", "-vf", "scale=320:320:force_original_aspect_ratio=decrease",
+        str(output),
+    )  # fmt: skip
+    return str(output) if output.is_file() else None
+
+
+async def keyframe_times(path: Path | str) -> list[float]:
+    """Seconds from the start of the file to each keyframe of its main video stream."""
+    output = await _run(
+        "ffprobe", "-v", "error", "-select_streams", "V:0", "-print_format", "json",
+        "-show_entries", "packet=pts_time,flags:format=start_time", str(path),
+    )  # fmt: skip
+    data = json.loads(output or b"{}")
+    start_time = float(data.get("format", {}).get("start_time") or 0)
+    return sorted(
+        float(packet["pts_time"]) - start_time
+        for packet in data.get("packets", [])
+        if "K" in packet.get("flags", "") and packet.get("pts_time") not in (None, "N/A")
+    )
+
+
+async def probe(path: Path | str, thumb: bool = False) -> MediaInfo:
+    """
+    Read duration, streams and dimensions with a single ffprobe call.
+
+    Results are cached by path, mtime and size, so probing the same
+    file again, e.g. on re-uploads, doesn't start any process.
+    :param thumb: Also extract a thumbnail for files with a video stream,
+        reused from the thumbnail cache for files with the same content.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    if (info := _CACHE.get(key)) is None:
+        output = await _run("ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path)
+        info = MediaInfo(json.loads(output or b"{}"))
+        if len(_CACHE) >= CACHE_SIZE:
+            _CACHE.pop(next(iter(_CACHE)))
+        _CACHE[key] = info
+
+    if thumb and info.has_video and not (info.thumb and os.path.isfile(info.thumb)):
+        thumb_key = await asyncio.to_thread(content_key, path)
+        info.thumb = await THUMB_CACHE.thumbnail(thumb_key, partial(extract_thumb, path, info.thumb_timestamp))
+
+    return info
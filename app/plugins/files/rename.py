@@ -3,10 +3,17 @@ import shutil
 import time
 from pathlib import Path
 
+from pyrogram import raw
+from ub_core.utils import get_tg_media_details
 from ub_core.utils.downloader import Download, DownloadedFile
 
 from app import BOT, Message, bot
-from app.plugins.files.download import telegram_download
+from app.plugins.files.download import TG_DOWNLOAD_WORKERS, telegram_download
+from app.plugins.files.jobs import JOBS
+from app.plugins.files.storage import STORAGE
+from app.plugins.files.tg_stream import iter_media_parallel, send_stream
+from app.plugins.files.thumb_cache import THUMB_CACHE
+from app.plugins.files.transfer_progress import PROGRESS
 from app.plugins.files.upload import upload_to_tg
 
 
@@ -15,7 +22,10 @@ async def rename(bot: BOT, message: Message):
     """
     CMD: RENAME
     INFO: Upload Files with custom name
-    FLAGS: -s for spoiler
+    FLAGS:
+        -s: spoiler
+        -d: upload as document
+        -dl: download to disk first instead of streaming TG media
     USAGE:
         .rename [ url | reply to message ] file_name.ext
     """
@@ -29,6 +39,10 @@ async def rename(bot: BOT, message: Message):
         )
         return
 
+    if message.replied and "-dl" not in message.flags:
+        await JOBS.run("rename", message, response, stream_rename(message=message, response=response, file_name=input))
+        return
+
     dl_path = Path("downloads") / str(time.time())
 
     await response.edit("Input verified....Starting Download...")
@@ -47,13 +61,16 @@ async def rename(bot: BOT, message: Message):
         dl_obj: Download = await Download.setup(
             url=url, dir=dl_path, message_to_edit=response, custom_file_name=file_name
         )
-        download_coro = dl_obj.download()
+        download_coro = STORAGE.run(dl_obj.download(), dl_path, dl_obj.size_bytes)
 
-    try:
+    async def download_and_upload():
         downloaded_file: DownloadedFile = await download_coro
         await upload_to_tg(file=downloaded_file, message=message, response=response)
         shutil.rmtree(dl_path, ignore_errors=True)
 
+    try:
+        await JOBS.run("rename", message, response, download_and_upload())
+
     except asyncio.exceptions.CancelledError:
         await response.edit("Cancelled....")
 
@@ -66,3 +83,67 @@ async def rename(bot: BOT, message: Message):
     finally:
         if dl_obj:
             await dl_obj.close()
+
+
+async def stream_rename(message: Message, response: Message, file_name: str):
+    """
+    Pipe the replied media into a new upload under file_name.
+    Parts are uploaded while later ones are still being fetched, nothing touches the disk.
+    """
+    replied = message.replied
+    client = message._client
+    media = get_tg_media_details(replied)
+    as_doc = "-d" in message.flags
+
+    attributes = []
+    if replied.video and not as_doc:
+        attributes.append(
+            raw.types.DocumentAttributeVideo(
+                duration=media.duration, w=media.width, h=media.height, supports_streaming=True
+            )
+        )
+    elif replied.audio and not as_doc:
+        attributes.append(
+            raw.types.DocumentAttributeAudio(duration=media.duration, title=media.title, performer=media.performer)
+        )
+
+    try:
+        thumb = reupload_thumb = None
+        # Thumbs can't be re-used by file_id, send the cached upload of the small original
+        if thumbs := getattr(media, "thumbs", None):
+            thumb_key = thumbs[0].file_unique_id
+
+            async def fetch_thumb(dest: Path):
+                thumb_file = await client.download_media(thumbs[0].file_id, in_memory=True)
+                await asyncio.to_thread(dest.write_bytes, thumb_file.getvalue())
+
+            async def reupload_thumb():
+                THUMB_CACHE.forget_upload(thumb_key)
+                return await THUMB_CACHE.input_file(client, thumb_key, thumb_path)
+
+            if thumb_path := await THUMB_CACHE.thumbnail(thumb_key, fetch_thumb):
+                thumb = await THUMB_CACHE.input_file(client, thumb_key, thumb_path)
+
+        with PROGRESS.track(response, media.file_size, "Renaming...", file_name) as transfer:
+            await send_stream(
+                client=client,
+                chat_id=message.chat.id,
+                chunk_iter=iter_media_parallel(client, replied, media.file_size, workers=TG_DOWNLOAD_WORKERS),
+                file_name=file_name,
+                file_size=media.file_size,
+                caption=file_name,
+                reply_to_message_id=message.reply_id,
+                on_part=transfer.update,
+                attributes=attributes,
+                thumb=thumb,
+                force_document=not attributes,
+                spoiler="-s" in message.flags,
+                reupload_thumb=reupload_thumb,
+            )
+        await response.delete()
+
+    except asyncio.exceptions.CancelledError:
+        await response.edit("Cancelled....")
+
+    except Exception as e:
+        await response.edit(str(e))
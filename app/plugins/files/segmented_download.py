@@ -0,0 +1,210 @@
+import asyncio
+import os
+from collections import deque
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import aiohttp
+from ub_core import Config
+from yarl import URL
+
+CONNECTIONS_PER_HOST = int(os.getenv("DOWNLOAD_CONNECTIONS_PER_HOST", 16))
+# Transfers run as long as data keeps coming, only a read stalled this many seconds times out
+STREAM_TIMEOUT = aiohttp.ClientTimeout(
+    total=None, sock_connect=30, sock_read=int(os.getenv("STREAM_READ_TIMEOUT", 60))
+)
+
+_SESSION: aiohttp.ClientSession | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Pooled session shared by segmented downloads, closed on exit."""
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=CONNECTIONS_PER_HOST, keepalive_timeout=60)
+        _SESSION = aiohttp.ClientSession(connector=connector, timeout=STREAM_TIMEOUT)
+        Config.TASK_MANAGER.add_exit(_SESSION.close)
+    return _SESSION
+
+
+class SegmentedDownload:
+    """
+    Fetch a file with several concurrent HTTP Range requests.
+
+    Segments are retried on their own from the last received byte,
+    so one dropped connection doesn't restart the whole transfer.
+    """
+
+    SEGMENT_SIZE = 8388608
+    READ_SIZE = 524288
+    MAX_RETRIES = 5
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        url: str | URL,
+        size: int,
+        connections: int = 4,
+        headers: Callable[[], Awaitable[dict]] | None = None,
+        on_progress: Callable[[int], None] | None = None,
+    ):
+        """
+        :param session: Pooled session to issue requests on.
+        :param url: Range capable url.
+        :param size: Total size in bytes.
+        :param connections: Concurrent range requests.
+        :param headers: Coroutine function returning extra headers, called per request.
+        :param on_progress: Called with the size of every received chunk.
+        """
+        self.session = session
+        self.url = url
+        self.size = size
+        self.connections = max(1, connections)
+        self.headers = headers
+        self.on_progress = on_progress
+        self.downloaded = 0
+        self.file_name: str | None = None
+        self.mime_type: str | None = None
+
+    @classmethod
+    async def from_url(
+        cls,
+        session: aiohttp.ClientSession,
+        url: str | URL,
+        connections: int = 4,
+        on_progress: Callable[[int], None] | None = None,
+    ) -> "SegmentedDownload | None":
+        """
+        Check that url serves byte ranges and has a known size.
+
+        Servers that don't answer HEAD properly are probed with a 1 byte range request.
+        :return: A SegmentedDownload pointed at the redirected url, None if ranges aren't supported.
+        """
+        async with session.head(url, allow_redirects=True) as resp:
+            headers = resp.headers if resp.ok else {}
+            disposition = resp.content_disposition if resp.ok else None
+            final_url = resp.url
+
+        accept_ranges = headers.get("Accept-Ranges", "").lower()
+        if accept_ranges == "none":
+            return None
+
+        if accept_ranges == "bytes" and headers.get("Content-Length"):
+            size = int(headers["Content-Length"])
+        else:
+            async with session.get(url, headers={"Range": "bytes=0-0"}) as resp:
+                if resp.status != 206:
+                    return None
+                headers = resp.headers
+                disposition = resp.content_disposition
+                final_url = resp.url
+                total = headers.get("Content-Range", "").rpartition("/")[2]
+                if not total.isdigit():
+                    return None
+                size = int(total)
+
+        if not size:
+            return None
+
+        downloader = cls(session, final_url, size, connections=connections, on_progress=on_progress)
+        downloader.file_name = (disposition and disposition.filename) or URL(url).name or None
+        downloader.mime_type = headers.get("Content-Type", "").partition(";")[0] or None
+        return downloader
+
+    def segments(self) -> list[tuple[int, int]]:
+        return [
+            (start, min(start + self.SEGMENT_SIZE, self.size) - 1) for start in range(0, self.size, self.SEGMENT_SIZE)
+        ]
+
+    async def fetch_segment(self, start: int, end: int, on_chunk: Callable[[int, bytes], None]):
+        pos = start
+
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                headers = await self.headers() if self.headers else {}
+                headers["Range"] = f"bytes={pos}-{end}"
+
+                async with self.session.get(self.url, headers=headers, timeout=STREAM_TIMEOUT) as resp:
+                    resp.raise_for_status()
+                    if resp.status != 206:
+                        raise ValueError("Server ignored the Range request.")
+
+                    async for chunk in resp.content.iter_chunked(self.READ_SIZE):
+                        on_chunk(pos, chunk)
+                        pos += len(chunk)
+                        self.downloaded += len(chunk)
+                        if self.on_progress:
+                            self.on_progress(len(chunk))
+
+                if pos > end:
+                    return
+                raise aiohttp.ClientPayloadError(f"Segment {start}-{end} ended at {pos}")
+
+            except (aiohttp.ClientError, ConnectionError, TimeoutError):
+                if attempt == self.MAX_RETRIES:
+                    raise
+                await asyncio.sleep(min(2**attempt, 30))
+
+    async def to_file(self, path: Path | str) -> Path:
+        """Write segments at their offsets into a preallocated file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        queue = deque(self.segments())
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        def write(pos: int, chunk: bytes):
+            os.pwrite(fd, chunk, pos)
+
+        async def worker():
+            while queue:
+                start, end = queue.popleft()
+                await self.fetch_segment(start, end, write)
+
+        try:
+            os.ftruncate(fd, self.size)
+            workers = [asyncio.create_task(worker()) for _ in range(self.connections)]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+        finally:
+            os.close(fd)
+
+        return path
+
+    async def iter_chunks(self):
+        """
+        Fetch segments concurrently into memory and yield them in file order.
+        At most connections + 1 segments are held at once.
+        """
+        semaphore = asyncio.Semaphore(self.connections)
+
+        async def fetch_to_memory(start: int, end: int) -> bytearray:
+            buffer = bytearray(end - start + 1)
+
+            def write(pos: int, chunk: bytes):
+                buffer[pos - start : pos - start + len(chunk)] = chunk
+
+            async with semaphore:
+                await self.fetch_segment(start, end, write)
+            return buffer
+
+        segments = iter(self.segments())
+        pending: deque[asyncio.Task] = deque()
+
+        try:
+            for start, end in segments:
+                pending.append(asyncio.create_task(fetch_to_memory(start, end)))
+                if len(pending) > self.connections:
+                    break
+
+            while pending:
+                buffer = await pending.popleft()
+                if next_segment := next(segments, None):
+                    pending.append(asyncio.create_task(fetch_to_memory(*next_segment)))
+                yield buffer
+        finally:
+            for task in pending:
+                task.cancel()
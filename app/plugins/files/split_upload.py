@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import math
+import os
+import shutil
+import time
+from pathlib import Path
+
+from pyrogram import raw
+from pyrogram.types import ReplyParameters
+from ub_core.utils import bytes_to_mb
+
+from app import BOT, Message
+from app.plugins.files.media_probe import keyframe_times, probe
+from app.plugins.files.tg_stream import send_stream
+from app.plugins.files.transfer_progress import PROGRESS, Transfer
+
+FILE_READ_SIZE = 4194304
+# Video parts aim below the limit, bitrate isn't constant
+VIDEO_PART_MARGIN = 0.9
+# Seconds cuts stay inside a part, well under a frame, so float rounding
+# of keyframe times never pulls in a neighbouring part's frames
+CUT_EPSILON = 0.001
+
+
+async def iter_file_range(path: Path | str, start: int, length: int, md5=None):
+    with open(path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = await asyncio.to_thread(file.read, min(FILE_READ_SIZE, length))
+            if not chunk:
+                break
+            if md5:
+                md5.update(chunk)
+            length -= len(chunk)
+            yield chunk
+
+
+async def split_upload(
+    client: BOT,
+    path: Path | str,
+    chat_id: int | str,
+    part_size: int,
+    response: Message,
+    reply_to_message_id: int | None = None,
+    as_doc: bool = False,
+):
+    """
+    Upload a file over the TG limit as several parts followed by a manifest.
+
+    Videos are cut on probed keyframes with ffmpeg stream copy so every part
+    plays on its own and no frame ends up in two parts, other files are split
+    on raw byte ranges and streamed from the original without extra disk use. Each part is uploaded while the
+    next one is being cut, at most two parts are on disk at once.
+    """
+    path = Path(path)
+    total_size = path.stat().st_size
+    md5 = None
+
+    with PROGRESS.track(response, total_size, "Uploading in parts...", path.name) as transfer:
+        info = None if as_doc else await probe(path)
+        if info and info.has_video and info.duration:
+            parts = await _split_video(client, path, chat_id, part_size, reply_to_message_id, transfer)
+        else:
+            md5 = hashlib.md5()
+            parts = await _split_raw(client, path, chat_id, part_size, reply_to_message_id, transfer, md5)
+
+    lines = "\n".join(
+        f"{index}. <code>{name}</code> [{bytes_to_mb(size)} mb]" for index, (name, size, _) in enumerate(parts, 1)
+    )
+    if md5:
+        rejoin = f"<code>cat '{path.name}'.0* > '{path.name}'</code>\n<b>MD5</b>: <code>{md5.hexdigest()}</code>"
+    else:
+        rejoin = "Parts play on their own, rejoin with ffmpeg's concat demuxer."
+
+    await client.send_message(
+        chat_id=chat_id,
+        text=(
+            f"<b>Split upload</b>: <code>{path.name}</code>"
+            f"\n<code>{bytes_to_mb(total_size)}</code> mb in <b>{len(parts)}</b> parts"
+            f"\n\n{lines}\n\n{rejoin}"
+        ),
+        reply_parameters=ReplyParameters(message_id=parts[0][2].id),
+    )
+
+
+async def _split_raw(
+    client: BOT,
+    path: Path,
+    chat_id: int | str,
+    part_size: int,
+    reply_to_message_id: int | None,
+    transfer: Transfer,
+    md5,
+) -> list[tuple[str, int, Message]]:
+    total_size = path.stat().st_size
+    count = math.ceil(total_size / part_size)
+    parts = []
+
+    for index in range(count):
+        start = index * part_size
+        size = min(part_size, total_size - start)
+        name = f"{path.name}.{index + 1:03d}"
+        sent = await send_stream(
+            client=client,
+            chat_id=chat_id,
+            chunk_iter=iter_file_range(path, start, size, md5),
+            file_name=name,
+            file_size=size,
+            caption=f"{name} [{index + 1}/{count}]",
+            reply_to_message_id=reply_to_message_id,
+            on_part=transfer.update,
+        )
+        parts.append((name, size, sent))
+
+    return parts
+
+
+def _cut_points(keyframes: list[float], part_duration: float, duration: float) -> list[float]:
+    """
+    Part start times: the last keyframe within part_duration of the previous start,
+    or the first one after it when a GOP is longer than a part.
+    """
+    points = [0.0]
+    previous = 0.0
+    for keyframe in keyframes:
+        if keyframe - points[-1] > part_duration:
+            points.append(previous if previous > points[-1] else keyframe)
+        previous = keyframe
+    if duration - points[-1] > part_duration and previous > points[-1]:
+        points.append(previous)
+    return points
+
+
+async def _cut_video(source: Path, output: Path, start: float, end: float | None) -> Path | None:
+    """
+    Stream copy start to end of source into output, both keyframe times.
+    Input seeking lands on the keyframe at or before -ss and the part stops
+    just before the keyframe that starts the next one.
+    """
+    start = start + CUT_EPSILON if start else 0
+    limit = ["-t", f"{end - CUT_EPSILON - start:.6f}"] if end else []
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-ss", f"{start:.6f}", "-i", str(source), *limit,
+        "-map", "0", "-c", "copy", "-avoid_negative_ts", "make_zero",
+        str(output),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )  # fmt: skip
+    try:
+        await proc.wait()
+    except asyncio.CancelledError:
+        # Don't leave ffmpeg writing into a work dir that is being removed
+        proc.kill()
+        await proc.wait()
+        raise
+    return output if output.is_file() and output.stat().st_size else None
+
+
+async def _split_video(
+    client: BOT,
+    path: Path,
+    chat_id: int | str,
+    part_size: int,
+    reply_to_message_id: int | None,
+    transfer: Transfer,
+) -> list[tuple[str, int, Message]]:
+    info = await probe(path)
+    part_duration = max(1.0, info.duration * part_size / path.stat().st_size * VIDEO_PART_MARGIN)
+    if not (keyframes := await keyframe_times(path)):
+        raise ValueError(f"ffprobe found no keyframes in {path.name}. Use -d for a raw split.")
+    points = _cut_points(keyframes, part_duration, info.duration)
+    count = len(points)
+    work_dir = Path("downloads") / f"split_{time.time()}"
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    def cut(index: int) -> asyncio.Task | None:
+        if index >= count:
+            return None
+        output = work_dir / f"{path.stem}.part{index + 1:03d}{path.suffix}"
+        end = points[index + 1] if index + 1 < count else None
+        return asyncio.create_task(_cut_video(path, output, points[index], end))
+
+    parts = []
+    next_part = cut(0)
+
+    try:
+        for index in range(count):
+            part = await next_part
+            # Cut the next part while this one uploads
+            next_part = cut(index + 1)
+
+            if part is None:
+                raise ValueError(f"ffmpeg couldn't cut part {index + 1} of {path.name}")
+
+            size = part.stat().st_size
+            if size > part_size:
+                raise ValueError(f"Part {index + 1} exceeds TG limits, bitrate too uneven. Use -d for a raw split.")
+
+            duration = (points[index + 1] if index + 1 < count else info.duration) - points[index]
+            sent = await send_stream(
+                client=client,
+                chat_id=chat_id,
+                chunk_iter=iter_file_range(part, 0, size),
+                file_name=part.name,
+                file_size=size,
+                caption=f"{part.name} [{index + 1}/{count}]",
+                reply_to_message_id=reply_to_message_id,
+                on_part=transfer.update,
+                attributes=[
+                    raw.types.DocumentAttributeVideo(
+                        duration=int(duration), w=info.width, h=info.height, supports_streaming=True
+                    )
+                ],
+                force_document=False,
+            )
+            parts.append((part.name, size, sent))
+            os.remove(part)
+    finally:
+        if next_part:
+            next_part.cancel()
+            await asyncio.gather(next_part, return_exceptions=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return parts
@@ -0,0 +1,255 @@
+import asyncio
+import errno
+import os
+import shutil
+import time
+from collections.abc import Coroutine
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from ub_core.utils import bytes_to_mb
+
+from app import BOT, Message, bot
+from app.plugins.files.media_cache import CACHE_DIR
+from app.plugins.files.thumb_cache import THUMB_DIR
+
+DOWNLOADS_DIR = Path("downloads")
+# Budget for downloads/ in MiB, 0 lets it use whatever the disk has
+DOWNLOADS_QUOTA = int(os.getenv("DOWNLOADS_QUOTA", 0)) * 1048576
+# Fractions of the budget: cleanup starts above HIGH and stops at LOW
+HIGH_WATERMARK = float(os.getenv("DOWNLOADS_HIGH_WATERMARK", 0.9))
+LOW_WATERMARK = float(os.getenv("DOWNLOADS_LOW_WATERMARK", 0.7))
+# Entries touched more recently than this many seconds are never evicted
+MIN_AGE = int(os.getenv("DOWNLOADS_MIN_AGE", 3600))
+
+
+def disk_size(stat: os.stat_result) -> int:
+    # Allocated bytes: preallocated downloads are sparse until written, their size is already reserved
+    blocks = getattr(stat, "st_blocks", None)
+    return blocks * 512 if blocks is not None else stat.st_size
+
+
+def _iter_stats(path: str):
+    if os.path.islink(path) or not os.path.isdir(path):
+        yield os.lstat(path)
+        return
+    for dir_path, _, files in os.walk(path):
+        for name in files:
+            try:
+                yield os.lstat(os.path.join(dir_path, name))
+            except FileNotFoundError:
+                continue
+
+
+def scan(root: Path, skip: set[str] = frozenset()) -> tuple[int, int, list[tuple[Path, int, float]]]:
+    """
+    :param skip: Top level names of active downloads, their bytes are counted apart
+        since their reservation already covers them.
+    :return: Bytes allocated under root outside and inside skip, and the other top level entries
+        as (path, freeable bytes, last modified), oldest first.
+        Hard links are counted once and bytes still linked elsewhere aren't freeable.
+    """
+    seen = set()
+    usage = 0
+    active_usage = 0
+    entries = []
+
+    if not root.is_dir():
+        return usage, active_usage, entries
+
+    for entry in os.scandir(root):
+        is_active = entry.name in skip
+        allocated = 0
+        freeable = 0
+        mtime = 0.0
+        try:
+            for stat in _iter_stats(entry.path):
+                mtime = max(mtime, stat.st_mtime)
+                if (key := (stat.st_dev, stat.st_ino)) in seen:
+                    continue
+                seen.add(key)
+                size = disk_size(stat)
+                allocated += size
+                if stat.st_nlink == 1:
+                    freeable += size
+        except FileNotFoundError:
+            continue
+
+        if is_active:
+            active_usage += allocated
+        else:
+            usage += allocated
+            entries.append((Path(entry.path), freeable, mtime))
+
+    entries.sort(key=lambda e: e[2])
+    return usage, active_usage, entries
+
+
+def remove(path: Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class StorageManager:
+    """
+    Keeps downloads/ within its budget.
+
+    Downloads reserve their advertised size up front and are refused when it
+    would push usage past the high watermark even after cleanup. Cleanup
+    deletes finished top level entries, oldest first, down to the low watermark.
+    """
+
+    def __init__(self, root: Path = DOWNLOADS_DIR):
+        self.root = root
+        self.usage = 0
+        self.limit = 0
+        self.reserved = 0
+        self.entries: list[tuple[Path, int, float]] = []
+        # Top level entry name -> downloads currently writing into it
+        self.active: dict[str, int] = {}
+        # Absolute path -> running uploads reading from it
+        self.held: dict[str, int] = {}
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        self.usage, active_usage, self.entries = await asyncio.to_thread(scan, self.root, set(self.active))
+        # Active downloads count through self.reserved alone, what they wrote so far is still budget
+        available = self.usage + active_usage + shutil.disk_usage(self.root if self.root.is_dir() else ".").free
+        self.limit = min(DOWNLOADS_QUOTA, available) if DOWNLOADS_QUOTA else available
+
+    async def collect(self, target: int) -> int:
+        """
+        Delete finished entries oldest first until usage drops to target.
+        Entries whose bytes are all linked elsewhere are kept, removing them frees nothing.
+        :return: Bytes freed.
+        """
+        freed = 0
+        now = time.time()
+
+        for path, size, mtime in self.entries:
+            if self.usage - freed <= target:
+                break
+            if (
+                not size
+                or path in (CACHE_DIR, THUMB_DIR)
+                or path.name in self.active
+                or self.is_held(path)
+                or now - mtime < MIN_AGE
+            ):
+                continue
+            await asyncio.to_thread(remove, path)
+            freed += size
+
+        if freed:
+            bot.log.info(f"Storage: freed {bytes_to_mb(freed)} mb from {self.root}")
+            await self.refresh()
+        return freed
+
+    async def cleanup(self, force: bool = False) -> int:
+        """Clean down to the low watermark once above the high one, or right away with force."""
+        async with self._lock:
+            await self.refresh()
+            if force or self.usage > self.limit * HIGH_WATERMARK:
+                return await self.collect(int(self.limit * LOW_WATERMARK))
+            return 0
+
+    async def admit(self, size: int) -> bool:
+        async with self._lock:
+            await self.refresh()
+            high = self.limit * HIGH_WATERMARK
+            if self.usage + self.reserved + size > high:
+                await self.collect(int(self.limit * LOW_WATERMARK) - self.reserved - size)
+            return self.usage + self.reserved + size <= high
+
+    @asynccontextmanager
+    async def reserve(self, path: Path | str, size: int):
+        """
+        Admit a download of size bytes into path and keep path safe
+        from cleanup until it finishes.
+        """
+        path = Path(path)
+        name = path.relative_to(self.root).parts[0] if path.is_relative_to(self.root) else path.name
+        # Mark active before admitting so the cleanup it may trigger leaves path alone
+        self.active[name] = self.active.get(name, 0) + 1
+        try:
+            if size and not await self.admit(size):
+                raise OSError(
+                    errno.ENOSPC,
+                    f"Not enough space in {self.root}/ for {bytes_to_mb(size)} mb, check .storage",
+                )
+            self.reserved += size
+            try:
+                yield
+            finally:
+                self.reserved -= size
+        finally:
+            if (count := self.active.pop(name) - 1) > 0:
+                self.active[name] = count
+
+    @asynccontextmanager
+    async def hold(self, *paths: Path | str):
+        """Keep paths, e.g. the inputs of running uploads, safe from cleanup without reserving space."""
+        held = [os.path.abspath(path) for path in paths]
+        for path in held:
+            self.held[path] = self.held.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            for path in held:
+                if (count := self.held.pop(path) - 1) > 0:
+                    self.held[path] = count
+
+    def is_held(self, entry: Path) -> bool:
+        """Whether entry is, contains or lies inside a held path."""
+        entry = os.path.abspath(entry)
+        return any(os.path.commonpath([entry, path]) in (entry, path) for path in self.held)
+
+    async def run(self, coro: Coroutine, path: Path | str, size: int):
+        """Await coro under a reservation."""
+        try:
+            async with self.reserve(path, size):
+                return await coro
+        finally:
+            # Frees the coroutine if it was refused before it started
+            coro.close()
+
+
+STORAGE = StorageManager()
+
+
+@BOT.register_worker(interval=int(os.getenv("DOWNLOADS_GC_INTERVAL", 300)), name="downloads-gc")
+async def downloads_gc_worker():
+    await STORAGE.cleanup()
+
+
+@BOT.add_cmd(cmd="storage")
+async def storage_usage(bot: BOT, message: Message):
+    """
+    CMD: STORAGE
+    INFO: Show disk usage of the downloads folder.
+    FLAGS: -c: clean finished downloads down to the low watermark now
+    USAGE:
+        .storage [-c]
+    """
+    response = await message.reply("Scanning downloads...")
+
+    if "-c" in message.flags:
+        freed = await STORAGE.cleanup(force=True)
+    else:
+        await STORAGE.refresh()
+
+    percent = STORAGE.usage * 100 / STORAGE.limit if STORAGE.limit else 0
+    text = (
+        f"<b>Storage</b>: <code>{STORAGE.root}/</code>"
+        f"\n\n<b>Used</b>: <code>{bytes_to_mb(STORAGE.usage)}/{bytes_to_mb(STORAGE.limit)}</code> mb"
+        f" [<code>{percent:.1f}%</code>]"
+        f"\n<b>Reserved</b>: <code>{bytes_to_mb(STORAGE.reserved)}</code> mb"
+        f" by <code>{sum(STORAGE.active.values())}</code> downloads"
+        f"\n<b>Watermarks</b>: <code>{HIGH_WATERMARK:.0%}</code> high | <code>{LOW_WATERMARK:.0%}</code> low"
+        f"\n<b>Entries</b>: <code>{len(STORAGE.entries)}</code>"
+    )
+    if "-c" in message.flags:
+        text += f"\n\n<b>Freed</b>: <code>{bytes_to_mb(freed)}</code> mb"
+    await response.edit(text)
@@ -0,0 +1,304 @@
+import asyncio
+import math
+import os
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from mimetypes import guess_type
+from pathlib import Path
+
+from pyrogram import raw, types
+from pyrogram.errors import BadRequest, FloodWait
+from pyrogram.session import Session
+
+from app import BOT
+
+PART_SIZE = 524288
+# Size of the parts yielded by stream_media
+MEDIA_CHUNK_SIZE = 1048576
+# Telegram treats anything above this as a big file
+BIG_FILE_SIZE = 10485760
+
+
+def allow_transmissions(client: BOT, count: int):
+    """
+    Let the client run at least count stream_media calls at once.
+    Pyrogram serialises them through get_file_semaphore, sized by
+    max_concurrent_transmissions (1 by default), which would make parallel workers take turns.
+    """
+    current = getattr(client, "max_concurrent_transmissions", None)
+    if current is None or current >= count:
+        return
+    client.max_concurrent_transmissions = count
+    # Transfers holding the old semaphore release it as they finish, new ones use the larger one
+    client.get_file_semaphore = asyncio.Semaphore(count)
+
+
+async def iter_media_parallel(
+    client: BOT,
+    message: types.Message,
+    file_size: int,
+    offset: int = 0,
+    workers: int = 4,
+    segment_chunks: int = 8,
+) -> AsyncIterator[bytes]:
+    """
+    Fetch Telegram media with several concurrent stream_media calls over
+    disjoint chunk ranges and yield the bytes in file order.
+
+    :param offset: Start position in 1 MiB chunks.
+    :param workers: Segments fetched at once.
+    :param segment_chunks: 1 MiB chunks per segment, memory use is about (workers + 1) * segment size.
+    """
+    if not file_size:
+        async for chunk in client.stream_media(message=message, offset=offset):
+            yield chunk
+        return
+
+    allow_transmissions(client, workers)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def fetch(index: int) -> list[bytes]:
+        async with semaphore:
+            return [chunk async for chunk in client.stream_media(message=message, offset=index, limit=segment_chunks)]
+
+    segments = iter(range(offset, math.ceil(file_size / MEDIA_CHUNK_SIZE), segment_chunks))
+    pending: deque[asyncio.Task] = deque()
+
+    try:
+        for index in segments:
+            pending.append(asyncio.create_task(fetch(index)))
+            if len(pending) > workers:
+                break
+
+        # Reorder buffer: segments complete in any order but are released strictly in sequence
+        while pending:
+            chunks = await pending.popleft()
+            if (index := next(segments, None)) is not None:
+                pending.append(asyncio.create_task(fetch(index)))
+            for chunk in chunks:
+                yield chunk
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def download_parallel(
+    client: BOT,
+    message: types.Message,
+    path: Path | str,
+    file_size: int,
+    workers: int = 4,
+    segment_chunks: int = 4,
+    on_chunk: Callable[[int], None] | None = None,
+) -> Path:
+    """
+    Download Telegram media with several concurrent stream_media calls,
+    writing every chunk at its offset into a preallocated file.
+
+    :param workers: Segments fetched at once.
+    :param segment_chunks: 1 MiB chunks per segment.
+    :param on_chunk: Called with the byte count of each written chunk.
+    """
+    allow_transmissions(client, workers)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    async def fetch(index: int, limit: int = 0):
+        position = index * MEDIA_CHUNK_SIZE
+        async for chunk in client.stream_media(message=message, offset=index, limit=limit):
+            os.pwrite(fd, chunk, position)
+            position += len(chunk)
+            if on_chunk:
+                on_chunk(len(chunk))
+
+    try:
+        if not file_size:
+            await fetch(0)
+            return path
+
+        os.ftruncate(fd, file_size)
+        segments = deque(range(0, math.ceil(file_size / MEDIA_CHUNK_SIZE), segment_chunks))
+
+        async def worker():
+            while segments:
+                await fetch(segments.popleft(), segment_chunks)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+    finally:
+        os.close(fd)
+
+    return path
+
+
+async def upload_stream(
+    client: BOT,
+    chunk_iter: AsyncIterator[bytes],
+    file_name: str,
+    file_size: int = 0,
+    workers: int = 4,
+    on_part: Callable[[int], None] | None = None,
+) -> raw.types.InputFile | raw.types.InputFileBig:
+    """
+    Upload bytes to Telegram as they arrive, without a local file.
+
+    :param chunk_iter: Async iterator of file bytes in order.
+    :param file_size: Total size, 0 if unknown.
+    :param workers: Parts in flight at once.
+    :param on_part: Called with the byte count of each uploaded part.
+    :return: InputFile to be used in a SendMedia request.
+    """
+    is_big = not file_size or file_size > BIG_FILE_SIZE
+    total_parts = math.ceil(file_size / PART_SIZE) if file_size else -1
+    file_id = client.rnd_id()
+
+    session = Session(
+        client,
+        await client.storage.dc_id(),
+        await client.storage.auth_key(),
+        await client.storage.test_mode(),
+        is_media=True,
+    )
+    await session.start()
+
+    queue: asyncio.Queue[tuple[int, bytes, int] | None] = asyncio.Queue(maxsize=workers * 2)
+
+    async def worker():
+        while (part := await queue.get()) is not None:
+            index, data, parts = part
+            if is_big:
+                request = raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id, file_part=index, file_total_parts=parts, bytes=data
+                )
+            else:
+                request = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=index, bytes=data)
+
+            while True:
+                try:
+                    await session.invoke(request)
+                    break
+                except FloodWait as e:
+                    await asyncio.sleep(e.value)
+
+            if on_part:
+                on_part(len(data))
+
+    part_count = 0
+
+    async def produce():
+        nonlocal part_count
+        buffer = bytearray()
+        held: bytes | None = None
+
+        async for chunk in chunk_iter:
+            buffer += chunk
+            while len(buffer) >= PART_SIZE:
+                # Hold one part back: with an unknown size only the last part may carry the real total
+                if held is not None:
+                    await queue.put((part_count - 1, held, total_parts))
+                held = bytes(buffer[:PART_SIZE])
+                del buffer[:PART_SIZE]
+                part_count += 1
+
+        if buffer:
+            if held is not None:
+                await queue.put((part_count - 1, held, total_parts))
+            held = bytes(buffer)
+            part_count += 1
+
+        if held is not None:
+            await queue.put((part_count - 1, held, part_count))
+
+        for _ in range(workers):
+            await queue.put(None)
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    tasks.append(asyncio.create_task(produce()))
+
+    try:
+        # A failed worker would leave the producer blocked on a full queue, stop at the first error
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
+
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await session.stop()
+
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=part_count, name=file_name)
+    return raw.types.InputFile(id=file_id, parts=part_count, name=file_name, md5_checksum="")
+
+
+async def upload_bytes(client: BOT, data: bytes, file_name: str) -> raw.types.InputFile | raw.types.InputFileBig:
+    """upload_stream for small in-memory files like thumbnails."""
+
+    async def chunk_iter():
+        yield data
+
+    return await upload_stream(client, chunk_iter(), file_name, len(data), workers=1)
+
+
+async def send_stream(
+    client: BOT,
+    chat_id: int | str,
+    chunk_iter: AsyncIterator[bytes],
+    file_name: str,
+    file_size: int = 0,
+    caption: str = "",
+    reply_to_message_id: int | None = None,
+    on_part: Callable[[int], None] | None = None,
+    attributes: list | None = None,
+    thumb: raw.types.InputFile | None = None,
+    force_document: bool = True,
+    spoiler: bool = False,
+    reupload_thumb: Callable[[], Awaitable[raw.types.InputFile]] | None = None,
+) -> types.Message | None:
+    """
+    Stream-upload bytes and send them as a document under file_name.
+    :param reupload_thumb: Called for a fresh thumb if Telegram rejects a previously uploaded one.
+    """
+    file = await upload_stream(client, chunk_iter, file_name, file_size, on_part=on_part)
+
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type=guess_type(file_name)[0] or "application/octet-stream",
+        file=file,
+        thumb=thumb,
+        force_file=force_document or None,
+        spoiler=spoiler or None,
+        attributes=[raw.types.DocumentAttributeFilename(file_name=file_name), *(attributes or [])],
+    )
+
+    reply_to = raw.types.InputReplyToMessage(reply_to_msg_id=reply_to_message_id) if reply_to_message_id else None
+
+    peer = await client.resolve_peer(chat_id)
+
+    async def send():
+        return await client.invoke(
+            raw.functions.messages.SendMedia(
+                peer=peer, media=media, message=caption, random_id=client.rnd_id(), reply_to=reply_to
+            )
+        )
+
+    try:
+        result = await send()
+    except BadRequest:
+        if not (thumb and reupload_thumb):
+            raise
+        # The uploaded file itself is still valid, only the thumb is sent again
+        media.thumb = await reupload_thumb()
+        result = await send()
+
+    users = {user.id: user for user in result.users}
+    chats = {chat.id: chat for chat in result.chats}
+
+    for update in result.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(client, update.message, users, chats)
@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+from pyrogram import raw
+
+from app import BOT
+from app.plugins.files.media_cache import MediaCache
+from app.plugins.files.tg_stream import upload_bytes
+
+THUMB_DIR = Path("downloads") / ".thumbs"
+# Disk budget in MiB for cached thumbnails
+THUMB_CACHE_SIZE = int(os.getenv("THUMB_CACHE_SIZE", 64)) * 1048576
+# Seconds an uploaded thumbnail is sent again before it is re-uploaded
+UPLOADED_THUMB_TTL = 3600
+# Bytes hashed from the start, middle and end of a file for its content key
+SAMPLE_SIZE = 262144
+
+
+def content_key(path: Path | str) -> str:
+    """
+    Hash of a file's size and three samples of its content.
+    Same for copies and renames of a file, without reading multi GB files in full.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as file:
+        for offset in sorted({0, max(0, size // 2 - SAMPLE_SIZE // 2), max(0, size - SAMPLE_SIZE)}):
+            file.seek(offset)
+            digest.update(file.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+class ThumbCache(MediaCache):
+    """
+    Thumbnail JPEGs keyed by content hash or file_unique_id.
+
+    Uploaded thumbnails are kept for a while too: Telegram doesn't take a
+    thumbnail by file_id, but an uploaded InputFile can be sent again.
+    """
+
+    def __init__(self, root: Path = THUMB_DIR, max_size: int = THUMB_CACHE_SIZE):
+        super().__init__(root=root, max_size=max_size)
+        self.uploaded: dict[str, tuple[raw.types.InputFile, float]] = {}
+
+    async def thumbnail(self, key: str, create: Callable[[Path], Awaitable]) -> str | None:
+        """
+        Path of the cached thumbnail for key, made through create(dest) on a miss.
+        Concurrent misses of the same key wait for a single create.
+        """
+        name = f"{key}.jpg"
+        async with self.single_flight(name):
+            if (cached := self.get(name)) is not None:
+                return str(cached)
+
+            dest = self.path(name)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            await create(dest)
+            if not dest.is_file():
+                return None
+
+            if name in self.entries:
+                self.size -= self.entries.pop(name)
+            self.entries[name] = size = dest.stat().st_size
+            self.size += size
+            self.evict()
+            return str(dest) if dest.is_file() else None
+
+    async def input_file(self, client: BOT, key: str, path: Path | str) -> raw.types.InputFile:
+        """The uploaded thumbnail for key, uploading path if none is fresh."""
+        now = time.time()
+        if (uploaded := self.uploaded.get(key)) and uploaded[1] > now:
+            return uploaded[0]
+
+        data = await asyncio.to_thread(Path(path).read_bytes)
+        file = await upload_bytes(client, data, "thumb.jpg")
+
+        self.uploaded = {k: v for k, v in self.uploaded.items() if v[1] > now}
+        self.uploaded[key] = (file, now + UPLOADED_THUMB_TTL)
+        return file
+
+    def forget_upload(self, key: str):
+        self.uploaded.pop(key, None)
+
+
+THUMB_CACHE = ThumbCache()
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from pyrogram.errors import FloodWait, MessageIdInvalid, MessageNotModified
+from ub_core.utils import bytes_to_mb
+
+from app import BOT, Message, bot
+
+
+class Transfer:
+    def __init__(self, message: Message, total: int, action_str: str, file_name: str | None = None):
+        self.message = message
+        self.total = total
+        self.current = 0
+        self.action_str = action_str
+        self.file_name = file_name
+        self.started = time.monotonic()
+
+    def update(self, size: int):
+        self.current += size
+
+    async def pyrogram_callback(self, current: int, total: int, *_):
+        """Drop-in for pyrogram's progress param."""
+        self.current = current
+        self.total = total or self.total
+
+    def render(self) -> str:
+        elapsed = time.monotonic() - self.started
+        speed = self.current / elapsed if elapsed else 0
+        percent = self.current * 100 / self.total if self.total else 0
+        filled = int(percent // 10)
+        eta = f"{int((self.total - self.current) / speed)}s" if speed and self.total else "-"
+
+        text = f"<b>{self.action_str}</b>"
+        if self.file_name:
+            text += f"\n<code>{self.file_name}</code>"
+        return (
+            f"{text}"
+            f"\n<code>[{'█' * filled}{'░' * (10 - filled)}] {percent:.1f}%</code>"
+            f"\n<b>Done</b>: <code>{bytes_to_mb(self.current)}/{bytes_to_mb(self.total)}</code> mb"
+            f"\n<b>Speed</b>: <code>{bytes_to_mb(speed)}</code> mb/s | <b>ETA</b>: <code>{eta}</code>"
+        )
+
+
+class ProgressScheduler:
+    """
+    Single edit loop for every registered transfer.
+
+    Each tick edits at most EDITS_PER_CHAT messages per chat, picking the
+    ones that waited longest, skips edits that wouldn't change the text
+    and pauses all edits while a FloodWait is pending.
+    """
+
+    EDITS_PER_CHAT = 2
+
+    def __init__(self):
+        self.transfers: dict[int, dict[int, Transfer]] = {}
+        self._last_text: dict[tuple[int, int], str] = {}
+        self._last_edit: dict[tuple[int, int], float] = {}
+        self._flood_until = 0.0
+
+    def register(self, message: Message, total: int, action_str: str, file_name: str | None = None) -> Transfer:
+        transfer = Transfer(message, total, action_str, file_name)
+        if isinstance(message, Message):
+            self.transfers.setdefault(message.chat.id, {})[message.id] = transfer
+        return transfer
+
+    def unregister(self, transfer: Transfer):
+        if not isinstance(transfer.message, Message):
+            return
+        chat_id, message_id = transfer.message.chat.id, transfer.message.id
+        chat_transfers = self.transfers.get(chat_id, {})
+        if chat_transfers.get(message_id) is transfer:
+            chat_transfers.pop(message_id)
+            self._last_text.pop((chat_id, message_id), None)
+            self._last_edit.pop((chat_id, message_id), None)
+        if not chat_transfers:
+            self.transfers.pop(chat_id, None)
+
+    @contextmanager
+    def track(self, message: Message, total: int, action_str: str, file_name: str | None = None):
+        transfer = self.register(message, total, action_str, file_name)
+        try:
+            yield transfer
+        finally:
+            self.unregister(transfer)
+
+    async def tick(self):
+        if time.monotonic() < self._flood_until:
+            return
+
+        for chat_id, chat_transfers in list(self.transfers.items()):
+            waiting = sorted(chat_transfers.values(), key=lambda t: self._last_edit.get((chat_id, t.message.id), 0))
+
+            for transfer in islice(waiting, self.EDITS_PER_CHAT):
+                key = (chat_id, transfer.message.id)
+                text = transfer.render()
+
+                if self._last_text.get(key) == text:
+                    continue
+
+                try:
+                    await transfer.message.edit(text)
+                except FloodWait as e:
+                    self._flood_until = time.monotonic() + e.value
+                    bot.log.info(f"Progress edits paused for {e.value}s due to FloodWait")
+                    return
+                except MessageNotModified:
+                    pass
+                except MessageIdInvalid:
+                    self.unregister(transfer)
+                    continue
+
+                self._last_text[key] = text
+                self._last_edit[key] = time.monotonic()
+
+            await asyncio.sleep(0)
+
+
+PROGRESS = ProgressScheduler()
+
+
+@BOT.register_worker(interval=5, name="transfer-progress")
+async def transfer_progress_worker():
+    if PROGRESS.transfers:
+        await PROGRESS.tick()
@@ -5,38 +5,52 @@ import time
 from functools import partial
 from typing import Union
 
-from pyrogram.types import ReplyParameters
+from pyrogram.errors import FloodWait
+from pyrogram.types import InputMediaDocument, InputMediaPhoto, InputMediaVideo, ReplyParameters
 from ub_core.utils import (
     Download,
     DownloadedFile,
     MediaType,
-    check_audio,
-    get_duration,
-    progress,
-    take_ss,
+    bytes_to_mb,
+    get_tg_media_details,
 )
 
-from app import BOT, Config, Message
+from app import BOT, Config, Message, bot
+from app.plugins.files.jobs import JOBS
+from app.plugins.files.media_cache import MEDIA_CACHE
+from app.plugins.files.media_probe import probe
+from app.plugins.files.split_upload import split_upload
+from app.plugins.files.storage import STORAGE
+from app.plugins.files.transfer_progress import PROGRESS
 
 UPLOAD_TYPES = Union[BOT.send_audio, BOT.send_document, BOT.send_photo, BOT.send_video]
 
+ALBUM_SIZE = 10
+BULK_UPLOAD_WORKERS = int(os.getenv("BULK_UPLOAD_WORKERS", 3))
+# Files having thumbnails and durations probed at once
+BULK_PREPARE_WORKERS = 4
+
 
 async def video_upload(bot: BOT, file: DownloadedFile, has_spoiler: bool) -> UPLOAD_TYPES:
-    thumb = await take_ss(file.path, path=file.path)
-    if not await check_audio(file.path):
+    info = await probe(file.path, thumb=True)
+    if not info.has_audio:
         return partial(
             bot.send_animation,
-            thumb=thumb,
+            thumb=info.thumb,
             unsave=True,
             animation=file.path,
-            duration=await get_duration(file.path),
+            duration=info.duration,
+            width=info.width,
+            height=info.height,
             has_spoiler=has_spoiler,
         )
     return partial(
         bot.send_video,
-        thumb=thumb,
+        thumb=info.thumb,
         video=file.path,
-        duration=await get_duration(file.path),
+        duration=info.duration,
+        width=info.width,
+        height=info.height,
         has_spoiler=has_spoiler,
     )
 
@@ -46,7 +60,7 @@ async def photo_upload(bot: BOT, file: DownloadedFile, has_spoiler: bool) -> UPL
 
 
 async def audio_upload(bot: BOT, file: DownloadedFile, *_, **__) -> UPLOAD_TYPES:
-    return partial(bot.send_audio, audio=file.path, duration=await get_duration(file=file.path))
+    return partial(bot.send_audio, audio=file.path, duration=(await probe(file.path)).duration)
 
 
 async def doc_upload(bot: BOT, file: DownloadedFile, *_, **__) -> UPLOAD_TYPES:
@@ -66,9 +80,32 @@ def file_exists(file: str) -> bool:
     return os.path.isfile(file)
 
 
+def size_limit(client: BOT) -> int:
+    """Max upload size in mb."""
+    return 3999 if client.me.is_premium else 1999
+
+
 def size_over_limit(size: int | float, client: BOT) -> bool:
-    limit = 3999 if client.me.is_premium else 1999
-    return size > limit
+    return size > size_limit(client)
+
+
+async def upload_in_parts(file: DownloadedFile, message: Message, response: Message):
+    try:
+        await split_upload(
+            client=message._client,
+            path=file.path,
+            chat_id=message.chat.id,
+            part_size=size_limit(message._client) * 1048576,
+            response=response,
+            reply_to_message_id=message.reply_id,
+            as_doc="-d" in message.flags,
+        )
+        await response.delete()
+    except asyncio.exceptions.CancelledError:
+        await response.edit("Cancelled....")
+        raise
+    except Exception as e:
+        await response.edit(f"Split upload failed for {file.name}:\n{e}")
 
 
 @BOT.add_cmd(cmd="upload")
@@ -95,6 +132,10 @@ async def upload(bot: BOT, message: Message):
 
     response = await message.reply("checking input...")
 
+    await JOBS.run("upload", message, response, upload_input(bot, message, response, input))
+
+
+async def upload_input(bot: BOT, message: Message, response: Message, input: str):
     if input in Config.CMD_DICT:
         await message.reply_document(document=Config.CMD_DICT[input].cmd_path)
         await response.delete()
@@ -102,17 +143,10 @@ async def upload(bot: BOT, message: Message):
 
     elif input.startswith("http") and not file_exists(input):
         try:
-            async with Download(
-                url=input,
-                dir=os.path.join("downloads", str(time.time())),
-                message_to_edit=response,
-            ) as dl_obj:
-                if size_over_limit(dl_obj.size, client=bot):
-                    await response.edit("<b>Aborted</b>, File size exceeds TG Limits!!!")
-                    return
-
+            dl_path = os.path.join("downloads", str(time.time()))
+            async with Download(url=input, dir=dl_path, message_to_edit=response) as dl_obj:
                 await response.edit("URL detected in input, Starting Download....")
-                file: DownloadedFile = await dl_obj.download()
+                file: DownloadedFile = await STORAGE.run(dl_obj.download(), dl_path, dl_obj.size_bytes)
 
         except asyncio.exceptions.CancelledError:
             await response.edit("Cancelled...")
@@ -129,10 +163,6 @@ async def upload(bot: BOT, message: Message):
     elif file_exists(input):
         file = DownloadedFile(file=input)
 
-        if size_over_limit(file.size, client=bot):
-            await response.edit("<b>Aborted</b>, File size exceeds TG Limits!!!")
-            return
-
     elif "-bulk" in message.flags:
         await bulk_upload(message=message, response=response)
         return
@@ -141,8 +171,110 @@ async def upload(bot: BOT, message: Message):
         await response.edit("invalid `cmd` | `url` | `file path`!!!")
         return
 
-    await response.edit("Uploading....")
-    await upload_to_tg(file=file, message=message, response=response)
+    async with STORAGE.hold(file.path):
+        if size_over_limit(file.size, client=bot):
+            await response.edit("File size exceeds TG Limits, uploading in parts....")
+            await upload_in_parts(file=file, message=message, response=response)
+            return
+
+        await response.edit("Uploading....")
+        await upload_to_tg(file=file, message=message, response=response)
+
+
+class AdaptiveRate:
+    """
+    Spaces out sends shared by all bulk upload workers.
+
+    The gap between sends doubles on every FloodWait, which also pauses
+    everyone for the requested time, and shrinks back after successes.
+    """
+
+    def __init__(self, min_gap: float = 0.5, max_gap: float = 30):
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.gap = min_gap
+        self._next = 0.0
+        self._resume_at = 0.0
+
+    async def wait(self):
+        slot = max(time.monotonic(), self._next)
+        self._next = slot + self.gap
+        await asyncio.sleep(slot - time.monotonic())
+        while (pause := self._resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(pause)
+
+    async def call(self, func, *args, **kwargs):
+        while True:
+            await self.wait()
+            try:
+                result = await func(*args, **kwargs)
+            except FloodWait as e:
+                self.gap = min(self.gap * 2, self.max_gap)
+                self._resume_at = max(self._resume_at, time.monotonic() + e.value)
+                bot.log.info(f"Bulk upload: FloodWait {e.value}s, send gap now {self.gap}s")
+                continue
+            self.gap = max(self.gap * 0.9, self.min_gap)
+            return result
+
+
+async def prepare_upload(
+    bot: BOT, file: DownloadedFile, as_doc: bool, has_spoiler: bool
+) -> tuple[str | None, InputMediaDocument | InputMediaPhoto | InputMediaVideo | partial]:
+    """
+    Probe the file and build what's needed to send it.
+
+    :return: Album kind and InputMedia for files that can go in an album, else None and a ready upload method.
+    """
+    if as_doc:
+        return "document", InputMediaDocument(media=file.path, caption=file.name)
+
+    if file.type == MediaType.PHOTO:
+        return "visual", InputMediaPhoto(media=file.path, caption=file.name, has_spoiler=has_spoiler)
+
+    # Videos without audio are sent as animations, which can't be grouped
+    if file.type == MediaType.VIDEO and (info := await probe(file.path, thumb=True)).has_audio:
+        return "visual", InputMediaVideo(
+            media=file.path,
+            thumb=info.thumb,
+            duration=info.duration,
+            width=info.width,
+            height=info.height,
+            caption=file.name,
+            has_spoiler=has_spoiler,
+        )
+
+    return None, await FILE_TYPE_MAP[file.type](bot=bot, file=file, has_spoiler=has_spoiler)
+
+
+async def cache_sent(sent: Message, file: DownloadedFile):
+    # Photos and gifs get re-encoded by TG, only cache media stored as sent
+    if not (sent and (sent.document or sent.video or sent.audio)):
+        return
+    try:
+        await MEDIA_CACHE.add(get_tg_media_details(sent).file_unique_id, file.path)
+    except Exception as e:
+        # The upload itself went through, a cache miss later is all this costs
+        bot.log.error(f"Couldn't cache {file.name}: {e}")
+
+
+def single_upload(bot: BOT, file: DownloadedFile, media: InputMediaDocument | InputMediaPhoto | InputMediaVideo):
+    """Send method for an album item left on its own."""
+    if isinstance(media, InputMediaPhoto):
+        return partial(bot.send_photo, photo=file.path, caption=media.caption, has_spoiler=media.has_spoiler)
+    if isinstance(media, InputMediaVideo):
+        return partial(
+            bot.send_video,
+            video=file.path,
+            thumb=media.thumb,
+            duration=media.duration,
+            width=media.width,
+            height=media.height,
+            caption=media.caption,
+            has_spoiler=media.has_spoiler,
+        )
+    return partial(
+        bot.send_document, document=file.path, caption=media.caption, disable_content_type_detection=True
+    )
 
 
 async def bulk_upload(message: Message, response: Message):
@@ -151,32 +283,128 @@ async def bulk_upload(message: Message, response: Message):
     else:
         path_regex = os.path.join(message.filtered_input, "*")
 
-    file_list = [f for f in glob.glob(path_regex) if file_exists(f)]
+    file_list = [f for f in sorted(glob.glob(path_regex)) if file_exists(f)]
 
     if not file_list:
         await response.edit("Invalid Folder path/regex or Folder Empty")
         return
 
-    await response.edit(f"Preparing to upload {len(file_list)} files.")
+    async with STORAGE.hold(*file_list):
+        await _bulk_upload(file_list, message, response)
+
+
+async def _bulk_upload(file_list: list[str], message: Message, response: Message):
+    client = message._client
+    files = []
+    oversized = []
 
     for file in file_list:
         file_info = DownloadedFile(file=file)
 
-        if size_over_limit(file_info.size, client=message._client):
-            await response.reply(f"Skipping {file_info.name} due to size exceeding limit.")
+        if size_over_limit(file_info.size, client=client):
+            oversized.append(file_info)
             continue
 
-        temp_resp = await response.reply(f"starting to upload `{file_info.name}`")
-
-        await upload_to_tg(file=file_info, message=message, response=temp_resp)
-        await asyncio.sleep(3)
+        files.append(file_info)
+
+    await response.edit(f"Preparing to upload {len(files)} files.")
+
+    as_doc = "-d" in message.flags
+    has_spoiler = "-s" in message.flags
+    reply_parameters = ReplyParameters(message_id=message.reply_id)
+    prepare_semaphore = asyncio.Semaphore(BULK_PREPARE_WORKERS)
+
+    async def prepare(file: DownloadedFile):
+        async with prepare_semaphore:
+            return await prepare_upload(client, file, as_doc, has_spoiler)
+
+    # Probing runs ahead of the uploads, bounded by the semaphore
+    prepared = [asyncio.create_task(prepare(file)) for file in files]
+
+    queue: asyncio.Queue[list | None] = asyncio.Queue(maxsize=BULK_UPLOAD_WORKERS * 2)
+    rate = AdaptiveRate()
+    counts = {"files": 0, "batches": 0, "failed": 0}
+
+    async def send(batch: list[tuple[DownloadedFile, str | None, object]]):
+        file, kind, media = batch[0]
+        if kind is None:
+            upload_method = partial(media, caption=file.name)
+        elif len(batch) == 1:
+            # Albums need at least 2 items
+            upload_method = single_upload(client, file, media)
+        else:
+            upload_method = None
+
+        if upload_method:
+            sent = [await rate.call(upload_method, chat_id=message.chat.id, reply_parameters=reply_parameters)]
+        else:
+            sent = await rate.call(
+                client.send_media_group,
+                chat_id=message.chat.id,
+                media=[media for _, _, media in batch],
+                reply_parameters=reply_parameters,
+            )
+        for sent_message, (file, *_) in zip(sent, batch):
+            await cache_sent(sent_message, file)
+
+    async def worker():
+        while (batch := await queue.get()) is not None:
+            try:
+                await send(batch)
+                counts["files"] += len(batch)
+                counts["batches"] += 1
+            except Exception as e:
+                counts["failed"] += len(batch)
+                bot.log.error(f"Bulk upload failed for {[file.name for file, *_ in batch]}: {e}")
+            transfer.update(sum(os.path.getsize(file.path) for file, *_ in batch))
+
+    start_time = time.perf_counter()
+    total_size = sum(os.path.getsize(file.path) for file in files)
+
+    with PROGRESS.track(response, total_size, "Bulk uploading...", f"{len(files)} files") as transfer:
+        workers = [asyncio.create_task(worker()) for _ in range(BULK_UPLOAD_WORKERS)]
+        try:
+            album = []
+            for file, task in zip(files, prepared):
+                try:
+                    kind, media = await task
+                except Exception as e:
+                    counts["failed"] += 1
+                    bot.log.error(f"Bulk upload couldn't prepare {file.name}: {e}")
+                    continue
+
+                if album and (kind != album[0][1] or len(album) == ALBUM_SIZE):
+                    await queue.put(album)
+                    album = []
+
+                if kind is None:
+                    await queue.put([(file, kind, media)])
+                else:
+                    album.append((file, kind, media))
+
+            if album:
+                await queue.put(album)
+
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in [*workers, *prepared]:
+                task.cancel()
+
+    await response.edit(
+        f"Uploaded <b>{counts['files']}</b> files in <b>{counts['batches']}</b> albums | messages."
+        f"\nFailed: <b>{counts['failed']}</b>"
+        f"\n\n<code>{bytes_to_mb(total_size)}</code> mb in <code>{time.perf_counter() - start_time:.1f}</code>s"
+    )
 
-    await response.delete()
+    # Over the limit files go last, one at a time, each part needs a full upload slot
+    for file in oversized:
+        part_response = await response.reply(f"Uploading <code>{file.name}</code> in parts...")
+        await upload_in_parts(file=file, message=message, response=part_response)
 
 
 async def upload_to_tg(file: DownloadedFile, message: Message, response: Message):
-    progress_args = (response, "Uploading...", file.path)
-
     if "-d" in message.flags:
         upload_method = partial(
             message._client.send_document,
@@ -189,13 +417,16 @@ async def upload_to_tg(file: DownloadedFile, message: Message, response: Message
         )
 
     try:
-        await upload_method(
-            chat_id=message.chat.id,
-            reply_parameters=ReplyParameters(message_id=message.reply_id),
-            progress=progress,
-            progress_args=progress_args,
-            caption=file.name,
-        )
+        with PROGRESS.track(response, 0, "Uploading...", file.name) as transfer:
+            sent = await upload_method(
+                chat_id=message.chat.id,
+                reply_parameters=ReplyParameters(message_id=message.reply_id),
+                progress=transfer.pyrogram_callback,
+                caption=file.name,
+            )
+
+        await cache_sent(sent, file)
+
         await response.delete()
 
     except asyncio.exceptions.CancelledError:
@@ -17,6 +17,7 @@ from pyrogram.utils import FileId
 from ub_core import utils as core_utils
 
 from app import BOT, Config, Message, bot, extra_config
+from app.plugins.files.media_cache import download_media
 
 EMOJIS = ("☕", "🤡", "🙂", "🤔", "🔪", "😂", "💀")
 
@@ -68,7 +69,7 @@ async def video_kang(message: Message, ff=False) -> tuple[str, None]:
 
     download_path.mkdir(parents=True, exist_ok=True)
 
-    await message.download(str(input_file))
+    await download_media(message=message, path=input_file)
 
     duration = getattr(video, "duration", None)
     if not duration:
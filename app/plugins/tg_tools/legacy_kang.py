@@ -12,6 +12,7 @@ from pyrogram.errors import StickersetInvalid
 from ub_core import utils as core_utils
 
 from app import BOT, Message, bot, extra_config
+from app.plugins.files.media_cache import download_media
 
 EMOJIS = ("☕", "🤡", "🙂", "🤔", "🔪", "😂", "💀")
 
@@ -47,7 +48,7 @@ async def photo_kang(message: Message, **_) -> dict:
     os.makedirs(download_path, exist_ok=True)
 
     input_file = os.path.join(download_path, "photo.jpg")
-    await message.download(input_file)
+    await download_media(message=message, path=input_file)
 
     file = await asyncio.to_thread(resize_photo, input_file)
 
@@ -77,7 +78,7 @@ async def video_kang(message: Message, ff=False) -> dict:
     input_file = os.path.join(download_path, "input.mp4")
     output_file = os.path.join(download_path, "sticker.webm")
 
-    await message.download(input_file)
+    await download_media(message=message, path=input_file)
 
     if not hasattr(video, "duration"):
         duration = await core_utils.get_duration(file=input_file)
@@ -0,0 +1,218 @@
+"""
+Transfer benchmarks against local stand-ins for file hosts, Drive and Telegram.
+
+Run from the repo root with the bot's environment installed:
+    python -m benchmarks [--size 256] [--latency 50] [--bandwidth 20] [--workers 4] [--only drive_url ...]
+
+Nothing talks to Telegram or Google, the real transfer code runs against
+BenchServer and FakeClient inside a throwaway working directory.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import aiohttp
+
+from benchmarks.fake_telegram import FakeClient, FakeMessage, fake_document
+from benchmarks.metrics import Counter, Monitor, render, result
+from benchmarks.server import BenchServer, Throttle, data_slice
+
+
+class MemoryDB:
+    """CustomDB stand-in for the upload session records."""
+
+    def __init__(self):
+        self.data: dict[str, dict] = {}
+
+    async def add_data(self, data: dict):
+        self.data[data["_id"]] = dict(data)
+
+    async def delete_data(self, query: dict):
+        self.data.pop(query["_id"], None)
+
+    async def find_one(self, query: dict):
+        return self.data.get(query["_id"])
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace, server: BenchServer, client: FakeClient):
+        self.args = args
+        self.size = args.size * 1048576
+        self.server = server
+        self.client = client
+
+    def reset_counters(self):
+        self.server.served = Counter()
+        self.server.received = Counter()
+        self.client.served = Counter()
+        self.client.received = Counter()
+        # Every run starts from the client's configured limit, the code under test may raise it
+        self.client.reset_transmissions(self.args.max_transmissions)
+
+    def drive(self):
+        from app.plugins.files import gdrive
+
+        gdrive.UPLOAD_URL = f"{self.server.url}/upload/drive/v3"
+        gdrive.DB = MemoryDB()
+
+        drive = gdrive.Drive()
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=drive.CONNECTIONS_PER_HOST)
+        drive._aiohttp_session = aiohttp.ClientSession(connector=connector)
+        drive._bearer = "Bearer benchmark"
+        drive._token_expires_at = math.inf
+        return drive
+
+    async def check_drive_file(self, file: dict, digest):
+        if digest.verify(file) is False:
+            raise AssertionError(f"md5 mismatch: {digest.summary(file)}")
+
+    async def drive_url(self) -> Counter:
+        """Drive._upload_from_url, counted in source chunks sent by the server."""
+        from app.plugins.files.gdrive import UploadDigest
+        from app.plugins.files.transfer_progress import Transfer
+
+        drive = self.drive()
+        digest = UploadDigest()
+        try:
+            file = await drive._upload_from_url(
+                self.server.file_url("drive_url.bin", self.size), transfer=Transfer(None, 0, ""), digest=digest
+            )
+        finally:
+            await drive._aiohttp_session.close()
+        await self.check_drive_file(file, digest)
+        return self.server.served
+
+    async def drive_telegram(self) -> Counter:
+        """Drive._upload_from_telegram, counted in 1 MiB media chunks."""
+        from app.plugins.files.gdrive import UploadDigest
+        from app.plugins.files.transfer_progress import Transfer
+
+        drive = self.drive()
+        drive.TG_WORKERS = self.args.workers
+        digest = UploadDigest()
+        media_message = FakeMessage(self.client, document=fake_document("drive_tg.bin", self.size))
+        try:
+            file = await drive._upload_from_telegram(
+                media_message, FakeMessage(self.client), transfer=Transfer(None, 0, ""), digest=digest
+            )
+        finally:
+            await drive._aiohttp_session.close()
+        await self.check_drive_file(file, digest)
+        return self.client.served
+
+    async def upload_to_tg(self) -> Counter:
+        """upload_to_tg as a document, counted in 512 KiB upload parts."""
+        from ub_core.utils import DownloadedFile
+
+        from app.plugins.files.upload import upload_to_tg
+
+        path = Path("downloads") / "upload_to_tg.bin"
+        file = DownloadedFile(file=path)
+        message = FakeMessage(self.client, flags=["-d"])
+        await upload_to_tg(file=file, message=message, response=FakeMessage(self.client))
+        return self.client.received
+
+    async def prepare_upload_to_tg(self):
+        path = Path("downloads") / "upload_to_tg.bin"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as file:
+            for start in range(0, self.size, 1048576):
+                file.write(data_slice(start, min(start + 1048576, self.size)))
+
+    async def telegram_download(self) -> Counter:
+        """telegram_download, counted in 1 MiB media chunks."""
+        from app.plugins.files.download import telegram_download
+
+        message = FakeMessage(self.client, document=fake_document("tg_download.bin", self.size))
+        await telegram_download(
+            message=message,
+            response=FakeMessage(self.client),
+            dir_name=Path("downloads") / "tg_download",
+            workers=self.args.workers,
+        )
+        return self.client.served
+
+    async def segmented_download(self) -> Counter:
+        """SegmentedDownload.to_file, counted in chunks sent by the server."""
+        from app.plugins.files.segmented_download import SegmentedDownload
+
+        async with aiohttp.ClientSession() as session:
+            downloader = await SegmentedDownload.from_url(
+                session, self.server.file_url("segmented.bin", self.size), connections=self.args.workers
+            )
+            await downloader.to_file(Path("downloads") / "segmented" / "segmented.bin")
+        return self.server.served
+
+    async def run(self, name: str) -> dict:
+        if prepare := getattr(self, f"prepare_{name}", None):
+            await prepare()
+        self.reset_counters()
+
+        async with Monitor() as monitor:
+            counter = await getattr(self, name)()
+
+        shutil.rmtree("downloads", ignore_errors=True)
+        return result(name, monitor, self.size, counter)
+
+
+BENCHMARKS = ["drive_url", "drive_telegram", "upload_to_tg", "telegram_download", "segmented_download"]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=256, help="file size in MiB")
+    parser.add_argument("--latency", type=float, default=50, help="per request latency in ms")
+    parser.add_argument("--bandwidth", type=float, default=20, help="per connection MiB/s, 0 for unlimited")
+    parser.add_argument("--workers", type=int, default=4, help="parallel connections / TG workers")
+    parser.add_argument(
+        "--max-transmissions", type=int, default=1, help="client's max_concurrent_transmissions, pyrogram defaults to 1"
+    )
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--json", type=Path, help="also write results to this file")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    throttle = Throttle(latency=args.latency / 1000, bandwidth=args.bandwidth * 1048576)
+
+    # Modules resolve downloads/ against the cwd, keep the real one untouched
+    json_path = args.json.resolve() if args.json else None
+    work_dir = tempfile.mkdtemp(prefix="plain_ub_bench_")
+    os.chdir(work_dir)
+
+    server = BenchServer(throttle)
+    await server.start()
+    bench = Bench(args, server, FakeClient(throttle, args.max_transmissions))
+
+    results = []
+    try:
+        for name in args.only:
+            try:
+                results.append(await bench.run(name))
+            except Exception as e:
+                print(f"{name} failed: {e!r}", file=sys.stderr)
+    finally:
+        await server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(
+        f"{args.size} MiB | latency {args.latency:g} ms | "
+        f"{f'{args.bandwidth:g} MiB/s' if args.bandwidth else 'unlimited'} per connection | {args.workers} workers"
+        f" | {args.max_transmissions} max transmissions\n"
+    )
+    print(render(results))
+
+    if json_path:
+        json_path.write_text(json.dumps({"args": vars(args) | {"json": str(json_path)}, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
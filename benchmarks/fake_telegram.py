@@ -0,0 +1,110 @@
+import asyncio
+import math
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from pyrogram.enums import MessageMediaType
+
+from benchmarks.metrics import Counter
+from benchmarks.server import Throttle, data_slice
+
+MEDIA_CHUNK_SIZE = 1048576
+UPLOAD_PART_SIZE = 524288
+
+
+class FakeMessage:
+    """Just enough of a pyrogram Message for the transfer code."""
+
+    def __init__(self, client: "FakeClient", chat_id: int = 1, flags: list[str] | None = None, document=None):
+        self._client = client
+        self.id = random.randint(1, 2**31)
+        self.chat = SimpleNamespace(id=chat_id)
+        self.flags = flags or []
+        self.reply_id = None
+        self.document = document
+        self.media = MessageMediaType.DOCUMENT if document else None
+        self.video = self.audio = self.photo = None
+        self.text = ""
+
+    async def edit(self, text: str, *_, **__):
+        self.text = text
+        return self
+
+    async def delete(self, *_, **__):
+        return True
+
+    async def reply(self, text: str, *_, **__):
+        return FakeMessage(self._client, self.chat.id)
+
+
+def fake_document(file_name: str, file_size: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        file_id=f"file_{file_name}",
+        file_unique_id=f"bench_{time.time_ns()}",
+        file_name=file_name,
+        file_size=file_size,
+        mime_type="application/octet-stream",
+        thumbs=None,
+    )
+
+
+class FakeClient:
+    """
+    Pyrogram client stand-in serving media from memory.
+
+    stream_media yields 1 MiB chunks like pyrogram, every call pays the
+    throttle's latency once and is capped to its bandwidth, the way a single
+    Telegram media connection behaves. Like pyrogram, each call holds
+    get_file_semaphore, sized by max_concurrent_transmissions, for its whole
+    run. send_document reads the file in upload sized parts at the same pace
+    and reports pyrogram style progress.
+    """
+
+    def __init__(self, throttle: Throttle, max_concurrent_transmissions: int = 1):
+        self.throttle = throttle
+        self.served = Counter()
+        self.received = Counter()
+        self.reset_transmissions(max_concurrent_transmissions)
+
+    def reset_transmissions(self, count: int):
+        self.max_concurrent_transmissions = count
+        self.get_file_semaphore = asyncio.Semaphore(count)
+
+    @staticmethod
+    def rnd_id() -> int:
+        return random.randint(-(2**63), 2**63 - 1)
+
+    async def stream_media(self, message: FakeMessage, limit: int = 0, offset: int = 0):
+        file_size = message.document.file_size
+        chunks = math.ceil(file_size / MEDIA_CHUNK_SIZE)
+        stop = min(chunks, offset + limit) if limit else chunks
+
+        async with self.get_file_semaphore:
+            await self.throttle.request()
+            started = time.perf_counter()
+            sent = 0
+            for index in range(offset, stop):
+                start = index * MEDIA_CHUNK_SIZE
+                chunk = data_slice(start, min(start + MEDIA_CHUNK_SIZE, file_size))
+                await self.throttle.transfer(len(chunk), started, sent)
+                sent += len(chunk)
+                self.served.add(len(chunk))
+                yield chunk
+
+    async def send_document(self, chat_id: int, document: str, progress=None, caption: str = "", **_):
+        file_size = os.path.getsize(document)
+        await self.throttle.request()
+        started = time.perf_counter()
+        sent = 0
+
+        with open(document, "rb") as file:
+            while part := await asyncio.to_thread(file.read, UPLOAD_PART_SIZE):
+                await self.throttle.transfer(len(part), started, sent)
+                sent += len(part)
+                self.received.add(len(part))
+                if progress:
+                    await progress(sent, file_size)
+
+        return FakeMessage(self, chat_id, document=fake_document(os.path.basename(document), file_size))
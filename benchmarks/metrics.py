@@ -0,0 +1,112 @@
+import asyncio
+import os
+import resource
+import sys
+import time
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """Resident set size in bytes, the lifetime peak where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Counter:
+    """Chunks and bytes moved by a fake endpoint."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.bytes = 0
+
+    def add(self, size: int):
+        self.chunks += 1
+        self.bytes += size
+
+
+class Monitor:
+    """
+    Samples RSS and event loop lag while a benchmark runs.
+
+    Lag is how late a sleep of interval seconds wakes up, anything the
+    transfer code does without yielding to the loop shows up there.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lags: list[float] = []
+        self.baseline_rss = 0
+        self.peak_rss = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def _sample(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+            self.peak_rss = max(self.peak_rss, current_rss())
+
+    async def __aenter__(self):
+        self.baseline_rss = self.peak_rss = current_rss()
+        self._task = asyncio.create_task(self._sample())
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    async def __aexit__(self, *_):
+        self.wall = time.perf_counter() - self._wall_start
+        self.cpu = time.process_time() - self._cpu_start
+        self._task.cancel()
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+    def lag_percentile(self, percent: float) -> float:
+        if not self.lags:
+            return 0.0
+        lags = sorted(self.lags)
+        return lags[min(len(lags) - 1, int(len(lags) * percent / 100))]
+
+
+def result(name: str, monitor: Monitor, size: int, counter: Counter) -> dict:
+    return {
+        "name": name,
+        "size_mb": size / 1048576,
+        "seconds": monitor.wall,
+        "mb_per_s": size / 1048576 / monitor.wall if monitor.wall else 0,
+        "peak_rss_mb": monitor.peak_rss / 1048576,
+        "rss_growth_mb": (monitor.peak_rss - monitor.baseline_rss) / 1048576,
+        "loop_lag_p99_ms": monitor.lag_percentile(99) * 1000,
+        "loop_lag_max_ms": max(monitor.lags, default=0) * 1000,
+        "chunks": counter.chunks,
+        # CPU time of the whole process per chunk moved, fakes included
+        "cpu_us_per_chunk": monitor.cpu * 1e6 / counter.chunks if counter.chunks else 0,
+    }
+
+
+# key, header, format
+COLUMNS = [
+    ("name", "benchmark", "<20"),
+    ("mb_per_s", "MB/s", ">9.1f"),
+    ("peak_rss_mb", "peak RSS", ">10.1f"),
+    ("rss_growth_mb", "RSS +", ">9.1f"),
+    ("loop_lag_p99_ms", "lag p99", ">9.2f"),
+    ("loop_lag_max_ms", "lag max", ">9.2f"),
+    ("chunks", "chunks", ">8"),
+    ("cpu_us_per_chunk", "us/chunk", ">10.1f"),
+]
+
+
+def render(results: list[dict]) -> str:
+    widths = [spec.split(".")[0] for _, _, spec in COLUMNS]
+    header = "".join(f"{title:{width}}" for (_, title, _), width in zip(COLUMNS, widths))
+    lines = [header, "-" * len(header)]
+    for row in results:
+        lines.append("".join(f"{row[key]:{spec}}" for key, _, spec in COLUMNS))
+    return "\n".join(lines)
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import random
+import re
+import time
+
+from aiohttp import web
+
+from benchmarks.metrics import Counter
+
+BLOCK_SIZE = 1048576
+# Same bytes every run, random enough that nothing compresses them
+DATA_BLOCK = random.Random(0).randbytes(BLOCK_SIZE)
+SEND_SIZE = 65536
+
+RANGE_REGEX = re.compile(r"bytes=(\d+)-(\d*)")
+CONTENT_RANGE_REGEX = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)")
+
+
+def data_slice(start: int, end: int) -> bytes:
+    """Bytes start to end, exclusive, of the endless DATA_BLOCK file."""
+    out = bytearray()
+    while start < end:
+        offset = start % BLOCK_SIZE
+        piece = DATA_BLOCK[offset : offset + min(BLOCK_SIZE - offset, end - start)]
+        out += piece
+        start += len(piece)
+    return bytes(out)
+
+
+class Throttle:
+    """Request latency plus a bandwidth cap per connection, both optional."""
+
+    def __init__(self, latency: float = 0, bandwidth: float = 0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    async def request(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def transfer(self, size: int, started: float, sent: int):
+        """Sleep until sent + size bytes are due at bandwidth since started."""
+        if not self.bandwidth:
+            return
+        if (delay := started + (sent + size) / self.bandwidth - time.perf_counter()) > 0:
+            await asyncio.sleep(delay)
+
+
+class BenchServer:
+    """
+    Local stand-in for file hosts and Drive's resumable upload API.
+
+    GET|HEAD /files/{name}?size=N serves N deterministic bytes with Range support,
+    /nr/files/... serves them without. /upload/drive/v3/files follows Drive's
+    resumable protocol: 308 with a Range header for accepted chunks, the file
+    json with its md5Checksum once the last byte arrives.
+    """
+
+    def __init__(self, throttle: Throttle, host: str = "127.0.0.1", port: int = 0):
+        self.throttle = throttle
+        self.host = host
+        self.port = port
+        self.served = Counter()
+        self.received = Counter()
+        self.sessions: dict[str, dict] = {}
+        self._runner: web.AppRunner | None = None
+
+        self.app = web.Application(client_max_size=0)
+        self.app.router.add_route("*", "/files/{name}", self.serve_file)
+        self.app.router.add_route("*", "/nr/files/{name}", self.serve_file)
+        self.app.router.add_post("/upload/drive/v3/files", self.create_session)
+        self.app.router.add_put("/upload/drive/v3/files", self.put_chunk)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def file_url(self, name: str, size: int, ranges: bool = True) -> str:
+        return f"{self.url}{'' if ranges else '/nr'}/files/{name}?size={size}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def serve_file(self, request: web.Request) -> web.StreamResponse:
+        size = int(request.query["size"])
+        ranges = not request.path.startswith("/nr/")
+        start, end = 0, size
+
+        headers = {
+            "Content-Type": "application/octet-stream",
+            "Content-Disposition": f'attachment; filename="{request.match_info["name"]}"',
+        }
+        if ranges:
+            headers["Accept-Ranges"] = "bytes"
+
+        status = 200
+        if ranges and (match := RANGE_REGEX.fullmatch(request.headers.get("Range", ""))):
+            start = int(match.group(1))
+            end = min(int(match.group(2)) + 1, size) if match.group(2) else size
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+            status = 206
+
+        headers["Content-Length"] = str(end - start)
+        await self.throttle.request()
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        if request.method == "HEAD":
+            return response
+
+        started = time.perf_counter()
+        sent = 0
+        for position in range(start, end, SEND_SIZE):
+            data = data_slice(position, min(position + SEND_SIZE, end))
+            await self.throttle.transfer(len(data), started, sent)
+            await response.write(data)
+            sent += len(data)
+            self.served.add(len(data))
+
+        await response.write_eof()
+        return response
+
+    async def create_session(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        upload_id = f"{time.time_ns()}"
+        self.sessions[upload_id] = {"name": body.get("name", upload_id), "committed": 0, "md5": hashlib.md5()}
+        await self.throttle.request()
+        return web.Response(headers={"Location": f"{self.url}/upload/drive/v3/files?upload_id={upload_id}"})
+
+    def _file(self, upload_id: str, session: dict) -> web.Response:
+        return web.json_response(
+            {"id": upload_id, "name": session["name"], "md5Checksum": session["md5"].hexdigest()}
+        )
+
+    def _incomplete(self, session: dict) -> web.Response:
+        headers = {"Range": f"bytes=0-{session['committed'] - 1}"} if session["committed"] else {}
+        return web.Response(status=308, headers=headers)
+
+    async def put_chunk(self, request: web.Request) -> web.Response:
+        upload_id = request.query.get("upload_id", "")
+        if (session := self.sessions.get(upload_id)) is None:
+            return web.Response(status=404, text="Upload session not found")
+
+        match = CONTENT_RANGE_REGEX.fullmatch(request.headers.get("Content-Range", ""))
+        if not match:
+            return web.Response(status=400, text="Bad Content-Range")
+
+        await self.throttle.request()
+        first, last, total = match.groups()
+
+        if first is None:
+            # Status query, or the empty final PUT of an upload of unknown size
+            if total != "*" and session["committed"] == int(total):
+                return self._file(upload_id, session)
+            return self._incomplete(session)
+
+        first, last = int(first), int(last)
+        if first > session["committed"]:
+            return web.Response(status=400, text="Chunk leaves a gap")
+
+        started = time.perf_counter()
+        position = first
+        async for data in request.content.iter_chunked(SEND_SIZE):
+            await self.throttle.transfer(len(data), started, position - first)
+            # Re-sent bytes Drive already has are dropped, like the real API
+            if (skip := session["committed"] - position) < len(data):
+                kept = data[max(skip, 0) :]
+                session["md5"].update(kept)
+                session["committed"] += len(kept)
+            position += len(data)
+            self.received.add(len(data))
+
+        if position != last + 1:
+            return web.Response(status=400, text="Body doesn't match Content-Range")
+
+        if total != "*" and session["committed"] == int(total):
+            return self._file(upload_id, session)
+        return self._incomplete(session)